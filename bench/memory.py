@@ -0,0 +1,62 @@
+"""Benchmark the memory used per row by loaded tables, with and without compact rows.
+
+Run from the repository root:
+
+    python bench/memory.py [rows]
+"""
+
+from typing import List
+
+import gc
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from csvql import database  # pylint: disable=wrong-import-position
+
+COUNTRIES = ["AU", "NZ", "GB", "US", "CA", "FR", "DE", "JP", "IN", "BR"]
+STATUSES = ["open", "closed", "pending"]
+
+
+def make_csv(path: str, rows: int) -> None:
+    """Write a log-like CSV with a unique id, categorical columns and a numeric column."""
+    rand = random.Random(0)
+    with open(path, "w") as csv_file:
+        csv_file.write("id,country,status,day,amount\n")
+        for i in range(rows):
+            csv_file.write(f"{i},{rand.choice(COUNTRIES)},{rand.choice(STATUSES)},"
+                           f"2020-01-{rand.randint(1, 28):02},{rand.randint(0, 99999)}\n")
+
+
+def bytes_per_row(path: str, rows: int, compact: bool) -> float:
+    """Measure the memory retained by `load_table`, divided by the row count."""
+    gc.collect()
+    tracemalloc.start()
+    table = database.load_table(path, compact)
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert table and len(table.rows) == rows
+    return used / rows
+
+
+def main(args: List[str]) -> None:
+    rows = int(args[0]) if args else 100000
+    handle, path = tempfile.mkstemp(suffix=".csv")
+    os.close(handle)
+    try:
+        make_csv(path, rows)
+        before = bytes_per_row(path, rows, compact=False)
+        after = bytes_per_row(path, rows, compact=True)
+    finally:
+        os.remove(path)
+    print(f"rows: {rows}")
+    print(f"list rows:    {before:8.1f} bytes/row")
+    print(f"compact rows: {after:8.1f} bytes/row ({after / before:.0%})")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
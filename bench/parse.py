@@ -0,0 +1,58 @@
+"""Benchmark the packrat parser in `reg_parse` against `parse.parse_query`, on growing scripts.
+
+Run from the repository root:
+
+    python bench/parse.py
+
+Both parsers should take a roughly constant time per statement as scripts grow.
+"""
+
+from typing import Callable, List
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from csvql import parse, reg_parse, tokenise  # pylint: disable=wrong-import-position
+from csvql.tokenise import Token  # pylint: disable=wrong-import-position
+
+STATEMENTS = [
+    "select name, id from food where cat = fruit and id > 1 order by name desc limit 10",
+    "select distinct cat from food order by cat offset 1 rows fetch first 2 rows only",
+    "select count(*), approx_quantile(id, 90) from food tablesample 10 percent",
+    "create materialized view cats as select distinct cat from food",
+]
+SIZES = [10, 100, 1000, 5000]
+REPEAT = 3
+
+
+def script(size: int) -> List[Token]:
+    return tokenise.tokenise("; ".join(STATEMENTS[i % len(STATEMENTS)] for i in range(size)))
+
+
+def recursive(tokens: List[Token]) -> None:
+    for statement in parse.split_statements(tokens):
+        parse.parse(statement)
+
+
+def packrat(tokens: List[Token]) -> None:
+    reg_parse.parse_script(tokens)
+
+
+def best(function: Callable[[List[Token]], None], tokens: List[Token]) -> float:
+    """Return the best of `REPEAT` runs, in seconds."""
+    return min(timeit.repeat(lambda: function(tokens), number=1, repeat=REPEAT))
+
+
+def main() -> None:
+    print(f"{'statements':>10} {'tokens':>8} {'parse_query (us/stmt)':>22} {'packrat (us/stmt)':>18}")
+    for size in SIZES:
+        tokens = script(size)
+        per_statement = [best(function, tokens) / size * 1e6 for function in (recursive, packrat)]
+        print(f"{size:>10} {len(tokens):>8} {per_statement[0]:>22.1f} {per_statement[1]:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
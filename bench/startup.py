@@ -0,0 +1,52 @@
+"""Benchmark csvql import time, using `python -X importtime`.
+
+Run from the repository root:
+
+    python bench/startup.py
+"""
+
+from typing import List, Tuple
+
+import subprocess
+import sys
+import time
+
+MODULES = ["csvql.execute", "csvql.web", "csvql.reg_parse"]
+REPEAT = 5
+
+
+def import_time(module: str) -> int:
+    """Return the cumulative import time of `module` in microseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    )
+    for line in result.stderr.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1])
+    raise ValueError(f"No import time reported for `{module}`.")
+
+
+def wall_time(code: str) -> float:
+    """Return the wall clock time, in seconds, to run `code` in a fresh interpreter."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    """Print the best of `REPEAT` runs for each module."""
+    rows: List[Tuple[str, int, float]] = []
+    baseline = min(wall_time("pass") for _ in range(REPEAT))
+    for module in MODULES:
+        cumulative = min(import_time(module) for _ in range(REPEAT))
+        wall = min(wall_time(f"import {module}") for _ in range(REPEAT)) - baseline
+        rows.append((module, cumulative, wall))
+    print(f"{'module':<20} {'importtime (us)':>16} {'wall (ms)':>10}")
+    for module, cumulative, wall in rows:
+        print(f"{module:<20} {cumulative:>16} {wall * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,7 @@
 """Run."""
 
-import logging
+import sys
 
-from csvql import web
+from csvql import cli
 
-logging.root.setLevel("DEBUG")
-
-web.main()
+sys.exit(cli.main())
@@ -0,0 +1,202 @@
+"""Aggregate functions, with an accumulator for each name in `grammer.AGGREGATE`.
+
+Accumulators are fed the values of one column. When a statement scans a sample of its table, they
+are told the sampled fraction and the number of rows sampled, scale their results up to estimate
+the whole table, and report 95% confidence bounds. Samples are drawn without replacement, so the
+bounds on counts and sums include the finite population correction `1 - fraction`.
+"""
+
+from typing import Dict, Optional, Set, Type
+
+import abc
+import logging
+import math
+
+from .filters import number
+from .memory import Budget, row_size
+from .sketches import HyperLogLog, QuantileSketch
+from .transactions import Aggregate
+
+log = logging.getLogger(__name__)
+
+Z_95 = 1.96
+
+
+def format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else f"{value:.6g}"
+
+
+class Accumulator(abc.ABC):
+    """Accumulate the values of one column for an aggregate."""
+
+    def __init__(self, aggregate: Aggregate, fraction: float = 1.0, sampled: int = 0,
+                 budget: Optional[Budget] = None) -> None:
+        self.aggregate = aggregate
+        self.fraction = fraction
+        self.sampled = sampled
+        self.budget = budget or Budget()
+
+    @abc.abstractmethod
+    def add(self, value: str) -> None:
+        pass
+
+    @abc.abstractmethod
+    def result(self) -> str:
+        pass
+
+    def bound(self) -> Optional[str]:
+        """Describe the error in `result`, if it is approximate."""
+        return None
+
+    def report(self, value: str) -> None:
+        """Log an approximate result with its error bound."""
+        bound = self.bound()
+        if bound:
+            log.info(f"`{self.aggregate.name}` ≈ {value}, {bound} (95% confidence).")
+
+
+def sample_error(accumulator: Accumulator, total: float, squares: float) -> float:
+    """Bound the error in a total estimated from a sample, given the sampled values' sum and sum
+    of squares, counting rows which were not accumulated as zeros."""
+    sampled = accumulator.sampled
+    if sampled < 2:
+        return math.inf
+    variance = max(0.0, squares - total ** 2 / sampled) / (sampled - 1)
+    return Z_95 * math.sqrt(variance * sampled * (1 - accumulator.fraction)) / accumulator.fraction
+
+
+class Count(Accumulator):
+    def __init__(self, aggregate: Aggregate, fraction: float = 1.0, sampled: int = 0,
+                 budget: Optional[Budget] = None) -> None:
+        super().__init__(aggregate, fraction, sampled, budget)
+        self.count = 0
+        self.values: Set[str] = set()
+
+    def add(self, value: str) -> None:
+        if self.aggregate.distinct:
+            if value not in self.values:
+                self.budget.allocate(row_size(value), f"`{self.aggregate.name}`")
+                self.values.add(value)
+        else:
+            self.count += 1
+
+    def result(self) -> str:
+        if self.aggregate.distinct:
+            return str(len(self.values))
+        return format_number(round(self.count / self.fraction))
+
+    def bound(self) -> Optional[str]:
+        if self.fraction == 1:
+            return None
+        if self.aggregate.distinct:
+            return "a lower bound, from the sample only"
+        # Each sampled row counts one if it was accumulated and zero otherwise.
+        return f"± {format_number(sample_error(self, self.count, self.count))}"
+
+
+class Sum(Accumulator):
+    def __init__(self, aggregate: Aggregate, fraction: float = 1.0, sampled: int = 0,
+                 budget: Optional[Budget] = None) -> None:
+        super().__init__(aggregate, fraction, sampled, budget)
+        self.total = 0.0
+        self.squares = 0.0
+        self.skipped = 0
+
+    def add(self, value: str) -> None:
+        value_number = number(value)
+        if value_number is None:
+            self.skipped += 1
+            return
+        self.total += value_number
+        self.squares += value_number ** 2
+
+    def result(self) -> str:
+        if self.skipped:
+            log.warning(f"`{self.aggregate.name}` skipped {self.skipped} values that are not numbers.")
+        return format_number(self.total / self.fraction)
+
+    def bound(self) -> Optional[str]:
+        if self.fraction == 1:
+            return None
+        return f"± {format_number(sample_error(self, self.total, self.squares))}"
+
+
+class Range(Accumulator):
+    def __init__(self, aggregate: Aggregate, fraction: float = 1.0, sampled: int = 0,
+                 budget: Optional[Budget] = None) -> None:
+        super().__init__(aggregate, fraction, sampled, budget)
+        self.low = math.inf
+        self.high = -math.inf
+
+    def add(self, value: str) -> None:
+        value_number = number(value)
+        if value_number is not None:
+            self.low = min(self.low, value_number)
+            self.high = max(self.high, value_number)
+
+    def result(self) -> str:
+        if self.low > self.high:
+            return ""
+        return format_number(self.high - self.low)
+
+    def bound(self) -> Optional[str]:
+        if self.fraction == 1:
+            return None
+        return "a lower bound, from the sample only"
+
+
+class ApproxCountDistinct(Accumulator):
+    def __init__(self, aggregate: Aggregate, fraction: float = 1.0, sampled: int = 0,
+                 budget: Optional[Budget] = None) -> None:
+        super().__init__(aggregate, fraction, sampled, budget)
+        self.sketch = HyperLogLog()
+
+    def add(self, value: str) -> None:
+        self.sketch.add(value)
+
+    def result(self) -> str:
+        return format_number(round(self.sketch.estimate()))
+
+    def bound(self) -> Optional[str]:
+        error = Z_95 * self.sketch.relative_error() * self.sketch.estimate()
+        if self.fraction < 1:
+            return f"± {format_number(round(error))} over the sample, a lower bound for the table"
+        return f"± {format_number(round(error))}"
+
+
+class ApproxQuantile(Accumulator):
+    def __init__(self, aggregate: Aggregate, fraction: float = 1.0, sampled: int = 0,
+                 budget: Optional[Budget] = None) -> None:
+        super().__init__(aggregate, fraction, sampled, budget)
+        self.sketch = QuantileSketch()
+        self.numeric = True
+        self.percent = float(aggregate.argument or 50)
+
+    def add(self, value: str) -> None:
+        if self.numeric and number(value) is None:
+            self.numeric = False
+        self.sketch.add(value)
+
+    def result(self) -> str:
+        value = self.sketch.quantile(self.percent / 100, float if self.numeric else None)
+        return "" if value is None else value
+
+    def bound(self) -> Optional[str]:
+        error = self.sketch.rank_error(sampled=self.fraction < 1)
+        if error == 0:
+            return None
+        return f"within ± {error * 100:.1f} percentiles"
+
+
+AGGREGATES: Dict[str, Type[Accumulator]] = {
+    "count": Count,
+    "sum": Sum,
+    "range": Range,
+    "approx_count_distinct": ApproxCountDistinct,
+    "approx_quantile": ApproxQuantile,
+}
+
+
+def accumulator(aggregate: Aggregate, fraction: float = 1.0, sampled: int = 0,
+                budget: Optional[Budget] = None) -> Accumulator:
+    return AGGREGATES[aggregate.function](aggregate, fraction, sampled, budget)
@@ -0,0 +1,133 @@
+"""Command-line interface for running queries without the web server."""
+
+from typing import Dict, Iterator, List, Optional, TextIO
+
+import argparse
+import csv
+import json
+import logging
+import sys
+
+from . import database, execute, memory
+from .database import Table
+
+log = logging.getLogger(__name__)
+
+FORMATS = ["csv", "ndjson"]
+
+
+def write_csv(columns: List[str], rows: Iterator[execute.Row], out: TextIO) -> None:
+    """Stream a result to `out` as CSV, header first."""
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+
+
+def write_ndjson(columns: List[str], rows: Iterator[execute.Row], out: TextIO) -> None:
+    """Stream a result to `out` as one JSON object per row."""
+    for row in rows:
+        out.write(json.dumps(dict(zip(columns, row))) + "\n")
+
+
+WRITERS = {"csv": write_csv, "ndjson": write_ndjson}
+
+
+def load_tables(args: argparse.Namespace) -> Dict[str, Table]:
+    """Build the database from `--data`, `--table` and `--stdin` arguments.
+
+    Files are only loaded once a statement refers to their table.
+    """
+    paths = database.table_paths(args.data) if args.data else {}
+    for spec in args.table:
+        name, _, path = spec.partition("=")
+        if not path:
+            name, path = database.table_name(spec) or spec, spec
+        paths[name] = path
+    tables = database.LazyTables(paths)
+    if args.stdin:
+        table = database.read_table(sys.stdin)
+        if table:
+            tables[args.stdin] = table
+        else:
+            log.warning("Unable to read a table from stdin.")
+    return tables
+
+
+def run_queries(queries: List[str], tables: Dict[str, Table], output_format: str,
+                out: TextIO, budget_limit: Optional[int] = None) -> bool:
+    """Run every statement in `queries`, streaming each result to `out`.
+
+    Each statement may use `budget_limit` bytes of memory. Returns whether all statements
+    succeeded.
+    """
+    writer = WRITERS[output_format]
+    succeeded = True
+    first = True
+    for query in queries:
+        for statement in execute.prepare(query):
+            budget = memory.Budget(budget_limit)
+            result = execute.stream(statement, tables, budget)
+            if not result:
+                succeeded = False
+                continue
+            if not first and output_format == "csv":
+                out.write("\n")
+            first = False
+            try:
+                writer(*result, out)
+            except memory.MemoryBudgetExceeded as err:
+                log.error(str(err))
+                succeeded = False
+            out.flush()
+            budget.report()
+    return succeeded
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="csvql", description=__doc__)
+    commands = parser.add_subparsers(dest="command")
+
+    serve = commands.add_parser("serve", help="run the web dashboard (default)")
+    serve.add_argument("--data", default=database.DATA_PATH, help="directory of CSV files")
+
+    query = commands.add_parser("query", help="run queries and write the results to stdout")
+    query.add_argument("query", nargs="?", help="`;`-separated statements to run")
+    query.add_argument("--data", help="directory of CSV files to load as tables")
+    query.add_argument("--table", action="append", default=[], metavar="[NAME=]PATH",
+                       help="load a single CSV file as a table (repeatable)")
+    query.add_argument("--stdin", metavar="NAME", help="read a CSV table called NAME from stdin")
+    query.add_argument("--file", action="append", default=[], metavar="PATH",
+                       help="read statements from a file (repeatable)")
+    query.add_argument("--format", choices=FORMATS, default="csv", help="output format")
+    query.add_argument("--parser", choices=execute.PARSERS, default=execute.PARSER,
+                       help="statement parser to use")
+    query.add_argument("--memory", metavar="SIZE",
+                       help="memory budget for each statement, e.g. 512MiB (default: unlimited)")
+    query.add_argument("--verbose", action="store_true", help="log progress to stderr")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the command line, returning the exit status."""
+    args = make_parser().parse_args(argv)
+    if args.command in (None, "serve"):
+        from . import web  # pylint: disable=import-outside-toplevel
+        logging.root.setLevel("DEBUG")
+        web.main(getattr(args, "data", database.DATA_PATH))
+        return 0
+    logging.basicConfig(level="INFO" if args.verbose else "WARNING",
+                        format='%(levelname)s (%(module)s): %(message)s')
+    queries = [args.query] if args.query else []
+    for path in args.file:
+        with open(path) as query_file:
+            queries.append(query_file.read())
+    if not queries:
+        log.error("No query given.")
+        return 2
+    budget_limit = memory.parse_size(args.memory) if args.memory else None
+    if args.memory and budget_limit is None:
+        return 2
+    execute.PARSER = args.parser
+    tables = load_tables(args)
+    return 0 if run_queries(queries, tables, args.format, sys.stdout, budget_limit) else 1
@@ -0,0 +1,172 @@
+"""Server-side cursors, which hold suspended query plans between page requests.
+
+A cursor's plan reads its table as it is paged through. Rows appended meanwhile are not read, but
+a table rewritten in place would be, so `Cursors.invalidate` closes the cursors over it. A cursor
+may hold a memory reservation. Between pages it keeps reserved only the memory its rows still hold,
+and `Cursors.resume` reserves its whole budget again before the next page is read. The reservation
+is released when the cursor is exhausted, closed or expires.
+"""
+
+from typing import Callable, Dict, Iterator, List, Optional
+from dataclasses import dataclass
+
+import itertools
+import logging
+import threading
+import time
+import uuid
+
+from .database import Row, Table
+from .memory import Budget, MemoryBudgetExceeded
+
+log = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 10000
+IDLE_TIMEOUT = 300.0
+
+
+@dataclass
+class Cursor:
+    """A partly consumed query result."""
+    cursor_id: str
+    columns: List[str]
+    rows: Iterator[Row]
+    last_used: float
+    fetched: int = 0
+    budget: Optional[Budget] = None
+    table: Optional[Table] = None
+    release: Optional[Callable[..., None]] = None
+    reserve: Optional[Callable[[Optional[int]], Callable[..., None]]] = None
+    suspended: bool = False
+
+    def close(self) -> None:
+        if self.release:
+            self.release()
+
+    def suspend(self) -> None:
+        """Keep reserved only the memory the cursor's rows still hold."""
+        if self.release and self.budget:
+            self.release(self.budget.used)
+            self.suspended = True
+
+    def resume(self) -> None:
+        """Reserve the cursor's whole budget again, waiting for it to be admitted."""
+        if self.suspended and self.reserve and self.budget:
+            self.close()
+            self.release = self.reserve(self.budget.limit)
+            self.suspended = False
+
+
+@dataclass
+class Page:
+    """Rows fetched from a cursor, and whether more remain."""
+    cursor_id: str
+    columns: List[str]
+    rows: List[Row]
+    more: bool
+    budget: Optional[Budget] = None
+
+
+class Cursors:
+    """A registry of open cursors, expiring those left idle for `timeout` seconds."""
+
+    def __init__(self, timeout: float = IDLE_TIMEOUT) -> None:
+        self.timeout = timeout
+        self._cursors: Dict[str, Cursor] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cursors)
+
+    def open(self, columns: List[str], rows: Iterator[Row], budget: Optional[Budget] = None,
+             table: Optional[Table] = None, release: Optional[Callable[..., None]] = None,
+             reserve: Optional[Callable[[Optional[int]], Callable[..., None]]] = None) -> str:
+        """Register a result's rows, read from `table` within `budget`, returning the cursor's id.
+
+        `release` releases the memory reserved for the cursor, keeping its argument's bytes, and
+        `reserve` reserves its budget again, as `memory.Governor.reserve` does.
+        """
+        cursor = Cursor(uuid.uuid4().hex, columns, rows, time.monotonic(),
+                        budget=budget, table=table, release=release, reserve=reserve)
+        with self._lock:
+            self._cursors[cursor.cursor_id] = cursor
+        return cursor.cursor_id
+
+    def fetch(self, cursor_id: str, size: int = PAGE_SIZE) -> Optional[Page]:
+        """Fetch the next page of a cursor, closing it once it is exhausted.
+
+        A cursor whose rows exceed its memory budget is closed, and the error raised.
+        """
+        self.expire()
+        with self._lock:
+            cursor = self._cursors.pop(cursor_id, None)
+        if not cursor:
+            log.error(f"Cursor `{cursor_id}` does not exist, has expired or its table was "
+                      "reloaded.")
+            return None
+        size = max(1, min(size, MAX_PAGE_SIZE))
+        try:
+            rows = list(itertools.islice(cursor.rows, size + 1))
+        except BaseException:
+            cursor.close()
+            raise
+        cursor.fetched += min(len(rows), size)
+        more = len(rows) > size
+        if more:
+            cursor.rows = itertools.chain(rows[size:], cursor.rows)
+            cursor.last_used = time.monotonic()
+            cursor.suspend()
+            with self._lock:
+                self._cursors[cursor_id] = cursor
+        else:
+            cursor.close()
+            log.info(f"Cursor `{cursor_id}` exhausted after {cursor.fetched} rows.")
+        return Page(cursor_id, cursor.columns, rows[:size], more, cursor.budget)
+
+    def resume(self, cursor_id: str) -> None:
+        """Wait for a cursor's memory budget to be admitted before its next page is fetched.
+
+        A cursor which times out waiting is closed, and the error raised.
+        """
+        with self._lock:
+            cursor = self._cursors.pop(cursor_id, None)
+        if not cursor:
+            return
+        try:
+            cursor.resume()
+        except MemoryBudgetExceeded:
+            cursor.close()
+            raise
+        cursor.last_used = time.monotonic()
+        with self._lock:
+            self._cursors[cursor_id] = cursor
+
+    def close(self, cursor_id: str) -> None:
+        with self._lock:
+            cursor = self._cursors.pop(cursor_id, None)
+        if cursor:
+            cursor.close()
+
+    def invalidate(self, table: Table, appended: Optional[List[Row]]) -> None:
+        """Close the cursors reading `table` if it was rewritten, as a `database.RefreshHook`."""
+        if appended is not None:
+            return
+        with self._lock:
+            closed = [self._cursors.pop(key) for key, cursor in list(self._cursors.items())
+                      if cursor.table is table]
+        for cursor in closed:
+            cursor.close()
+        if closed:
+            log.warning(f"Closed {len(closed)} cursors over a table that was reloaded.")
+
+    def expire(self) -> None:
+        """Close cursors which have not been used within the timeout."""
+        deadline = time.monotonic() - self.timeout
+        with self._lock:
+            expired = [self._cursors.pop(key) for key, cursor in list(self._cursors.items())
+                       if cursor.last_used < deadline]
+        for cursor in expired:
+            cursor.close()
+        if expired:
+            log.debug(f"Expired {len(expired)} idle cursors.")
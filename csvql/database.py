@@ -1,31 +1,331 @@
 """Provides read and write on CSV files."""
 
-from typing import NamedTuple, List, Optional
+from typing import NamedTuple, List, Optional, Dict, Iterable, Iterator, BinaryIO, Callable, Sequence, Tuple
+from dataclasses import dataclass
 
+import contextlib
 import csv
 import logging
+import operator
+import os
+import re
+import threading
+import zlib
+
+from . import readahead
 
 log = logging.getLogger(__name__)
 
 DB_PATH = "../data/categories.csv"
+DATA_PATH = "../data/"
+
+ENCODING = "utf-8"
+
+# Number of bytes at each end of the loaded prefix that are checksummed to detect rewrites.
+CHECK_SIZE = 64 * 1024
+
+# A column stops being dictionary encoded once its distinct values outnumber this fraction of the
+# rows read, checked every `DICTIONARY_CHECK` rows.
+DICTIONARY_RATIO = 0.5
+DICTIONARY_CHECK = 4096
+
+TABLE_FILE = re.compile(r"^(?P<name>.*)\.csv(\.gz|\.zst)?$")
+
+Row = Sequence[str]
+
+class Encoder:
+    """Compacts rows into tuples, sharing one string object per distinct value in each column."""
+
+    def __init__(self, width: int) -> None:
+        self.width = width
+        self.dictionaries: List[Optional[Dict[str, str]]] = [{} for _ in range(width)]
+        self.count = 0
+
+    def prune(self) -> None:
+        """Stop encoding columns which are mostly unique values."""
+        for i, dictionary in enumerate(self.dictionaries):
+            if dictionary is not None and len(dictionary) > DICTIONARY_RATIO * self.count:
+                self.dictionaries[i] = None
+
+    def __call__(self, row: List[str]) -> Row:
+        self.count += 1
+        if self.count % DICTIONARY_CHECK == 0:
+            self.prune()
+        if len(row) != self.width:
+            return tuple(row)
+        return tuple([
+            value if dictionary is None else dictionary.setdefault(value, value)
+            for dictionary, value in zip(self.dictionaries, row)
+        ])
+
+def projector(column_idx: List[int]) -> Callable[[Row], Tuple[str, ...]]:
+    """Make a function picking the given columns out of a row, as a tuple."""
+    if len(column_idx) == 1:
+        idx = column_idx[0]
+        return lambda row: (row[idx],)
+    return operator.itemgetter(*column_idx)
+
+def encode(rows: Iterable[List[str]], encoder: Optional[Encoder]) -> List[Row]:
+    if encoder is None:
+        return list(rows)
+    return [encoder(row) for row in rows]
+
+@dataclass
+class Source:
+    """Records how much of a CSV file has been loaded, so that appends can be read incrementally."""
+    path: str
+    offset: int
+    row_count: int
+    checksum: int
+    size: int
+    mtime: float
+    partial: bool = False
+    encoder: Optional[Encoder] = None
+    compressed: bool = False
 
 class Table(NamedTuple):
     """Define a SQL table/view."""
     columns: List[str]
-    rows: List[List[str]]
-
-def load_table(db_path: str) -> Optional[Table]:
-    """Load a CSV file into a `Table`."""
-    with open(db_path) as csv_file:
-        reader = csv.reader(csv_file)
-        columns: Optional[List[str]] = None
-        rows: List[List[str]] = []
-        for row in reader:
-            if not columns:
-                columns = row
+    rows: List[Row]
+    source: Optional[Source] = None
+
+# Called with a table and its newly appended rows after a refresh, or with `None` in place of the
+# rows if the table had to be reloaded in full.
+RefreshHook = Callable[[Table, Optional[List[Row]]], None]
+
+REFRESH_HOOKS: List[RefreshHook] = []
+
+class ReadWriteLock:
+    """A lock held by any number of readers, or by one writer. Waiting writers go first."""
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextlib.contextmanager
+    def reading(self) -> Iterator[None]:
+        with self._condition:
+            self._condition.wait_for(lambda: not self._writing and not self._writers_waiting)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def writing(self) -> Iterator[None]:
+        with self._condition:
+            self._writers_waiting += 1
+            self._condition.wait_for(lambda: not self._writing and not self._readers)
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+# Held for writing while tables are refreshed, and for reading by servers while queries read them,
+# so that a table is not reloaded in place as it is read, nor refreshed twice at once.
+TABLES_LOCK = ReadWriteLock()
+
+def read_table(csv_file: Iterable[str], compact: bool = True) -> Optional[Table]:
+    """Read CSV lines into a `Table`, taking the first row as the column names.
+
+    In compact mode rows are stored as tuples, and repeated values in a column share one string.
+    """
+    reader = csv.reader(csv_file)
+    columns = next(reader, None)
+    if not columns:
+        return None
+    return Table(columns, encode(reader, Encoder(len(columns)) if compact else None))
+
+class ByteLines:
+    """Decode the lines of a binary file for `csv.reader`, counting bytes of complete lines.
+
+    An unfinished last line is only read if `complete_only` is false, which marks it `partial`.
+    """
+
+    def __init__(self, handle: BinaryIO, offset: int = 0, complete_only: bool = False) -> None:
+        self.handle = handle
+        self.offset = offset
+        self.complete_only = complete_only
+        self.partial = False
+
+    def __iter__(self) -> Iterator[str]:
+        for line in self.handle:
+            if line.endswith(b"\n"):
+                self.offset += len(line)
+            elif self.complete_only:
+                return
             else:
-                rows.append(row)
-        if columns:
-            return Table(columns, rows)
-    log.warning("Unable to load file at {db_path}.")
+                self.partial = True
+            yield line.decode(ENCODING)
+
+def checksum(handle: BinaryIO, offset: int) -> int:
+    """Checksum the first and last `CHECK_SIZE` bytes before `offset`."""
+    handle.seek(0)
+    value = zlib.crc32(handle.read(min(CHECK_SIZE, offset)))
+    handle.seek(max(0, offset - CHECK_SIZE))
+    return zlib.crc32(handle.read(min(CHECK_SIZE, offset)), value)
+
+def make_source(handle: BinaryIO, path: str, lines: ByteLines, row_count: int,
+                encoder: Optional[Encoder]) -> Source:
+    stat = os.stat(path)
+    if readahead.compression(path):
+        return Source(path, lines.offset, row_count, 0, stat.st_size, stat.st_mtime,
+                      lines.partial, encoder, compressed=True)
+    return Source(path, lines.offset, row_count, checksum(handle, lines.offset),
+                  stat.st_size, stat.st_mtime, lines.partial, encoder)
+
+def open_csv(path: str) -> BinaryIO:
+    """Open a CSV file for binary reading, decompressing it if needed."""
+    if readahead.compression(path):
+        return readahead.open_compressed(path)
+    return open(path, 'rb')
+
+def table_name(path: str) -> Optional[str]:
+    """Name a table after its file, without the `.csv` and compression extensions."""
+    match = TABLE_FILE.match(os.path.basename(path))
+    return match.group('name') if match and match.group('name') else None
+
+def load_table(db_path: str, compact: bool = True) -> Optional[Table]:
+    """Load a (possibly compressed) CSV file into a `Table`, see `read_table`."""
+    try:
+        with open_csv(db_path) as csv_file:
+            lines = ByteLines(csv_file)
+            reader = csv.reader(lines)
+            columns = next(reader, None)
+            if columns:
+                encoder = Encoder(len(columns)) if compact else None
+                rows = encode(reader, encoder)
+                return Table(columns, rows,
+                             make_source(csv_file, db_path, lines, len(rows), encoder))
+    except (OSError, EOFError) as err:
+        log.warning(f"Unable to load file at {db_path}: {err}")
+        return None
+    log.warning(f"Unable to load file at {db_path}.")
     return None
+
+def reload_table(table: Table, source: Source) -> Table:
+    """Reload `table` from its file in full, replacing its contents in place."""
+    log.info(f"Reloading `{source.path}` in full.")
+    fresh = load_table(source.path, source.encoder is not None)
+    if not fresh or not fresh.source:
+        return table
+    table.columns[:] = fresh.columns
+    table.rows[:] = fresh.rows
+    vars(source).update(vars(fresh.source))
+    for hook in REFRESH_HOOKS:
+        hook(table, None)
+    return table
+
+def has_changed(source: Source) -> bool:
+    """Check whether a source file has been modified since it was last read."""
+    try:
+        stat = os.stat(source.path)
+    except OSError:
+        return True
+    return stat.st_size != source.size or stat.st_mtime != source.mtime
+
+def refresh_table(table: Table) -> Table:
+    """Bring a loaded table up to date with its file.
+
+    Rows appended since the last load are parsed and added to the table in place. If the bytes
+    already loaded have changed the table is reloaded in full instead.
+    """
+    source = table.source
+    if not source or not has_changed(source):
+        return table
+    with TABLES_LOCK.writing():
+        # Another thread may have refreshed the table while this one waited.
+        if not has_changed(source):
+            return table
+        return update_table(table, source)
+
+def update_table(table: Table, source: Source) -> Table:
+    if not os.path.exists(source.path):
+        log.warning(f"Unable to refresh from {source.path}.")
+        return table
+    if source.compressed or os.path.getsize(source.path) < source.offset:
+        return reload_table(table, source)
+    with open(source.path, 'rb') as csv_file:
+        if checksum(csv_file, source.offset) != source.checksum:
+            return reload_table(table, source)
+        csv_file.seek(source.offset)
+        # A line still being written is left for the next refresh.
+        lines = ByteLines(csv_file, source.offset, complete_only=True)
+        appended = encode(csv.reader(lines), source.encoder)
+        partial = source.partial
+        if partial and appended:
+            # The last row was loaded from an unfinished line, which is read again now it is done.
+            if not table.rows or appended[0] != table.rows[-1]:
+                return reload_table(table, source)
+            del appended[0]
+            partial = False
+        table.rows.extend(appended)
+        vars(source).update(vars(make_source(csv_file, source.path, lines,
+                                             source.row_count + len(appended), source.encoder)))
+        source.partial = partial
+    log.debug(f"Appended {len(appended)} rows from {source.path}.")
+    for hook in REFRESH_HOOKS:
+        hook(table, appended)
+    return table
+
+def refresh_database(database: Dict[str, Table]) -> None:
+    """Refresh every table in `database` that was loaded from a file."""
+    for table in list(database.values()):
+        refresh_table(table)
+
+def table_paths(data_path: str = DATA_PATH) -> Dict[str, str]:
+    """Find the CSV files in a directory, keyed by file name without extension."""
+    paths: Dict[str, str] = {}
+    for file in sorted(os.listdir(data_path)):
+        name = table_name(file)
+        if name:
+            paths[name] = os.path.join(data_path, file)
+    return paths
+
+def load_directory(data_path: str = DATA_PATH, compact: bool = True) -> Dict[str, Table]:
+    """Load every CSV file in a directory, keyed by file name without extension."""
+    tables: Dict[str, Table] = {}
+    for name, path in table_paths(data_path).items():
+        table = load_table(path, compact)
+        if not table:
+            continue
+        tables[name] = table
+    return tables
+
+class LazyTables(Dict[str, Table]):
+    """Tables keyed by name, each loaded from its file the first time it is looked up.
+
+    Only loaded tables are iterated over, so refreshing the database does not load the rest.
+    """
+
+    def __init__(self, paths: Dict[str, str], compact: bool = True) -> None:
+        super().__init__()
+        self.paths = dict(paths)
+        self.compact = compact
+
+    def __missing__(self, name: str) -> Table:
+        # A file that fails to load is not tried again.
+        path = self.paths.pop(name, None)
+        table = load_table(path, self.compact) if path else None
+        if table is None:
+            raise KeyError(name)
+        self[name] = table
+        return table
+
+    def __contains__(self, name: object) -> bool:
+        return super().__contains__(name) or name in self.paths
+
+    def get(self, name: str, default: Optional[Table] = None) -> Optional[Table]:  # type: ignore
+        try:
+            return self[name]
+        except KeyError:
+            return default
@@ -1,55 +1,247 @@
 # Basic SQL Implementation
 """Implements SQL engine."""
 
-from typing import Dict, Any, List, Optional
+from typing import Dict, List, Optional, Iterator, Set, Tuple, Union
 
+import functools
 import logging
+import operator
 
 
-from .database import Table
+from .database import Table, Row
 
+from . import tokenise
 from . import parse
+from . import reg_parse
 from . import interpret
-from .transactions import Select
+from . import views
+from . import memory
+from .plans import DistinctSorter, Plan, plan
+from .transactions import Select, CreateView, Explain, Statement
 
 log = logging.getLogger(__name__)
 
+PLAN_CACHE_SIZE = 256
+
+# The parser used by `prepare`: `recursive` is `parse.parse`, and `packrat` is
+# `reg_parse.parse_script`, which parses the same statements in linear time but a little slower.
+PARSERS = ["recursive", "packrat"]
+PARSER = "recursive"
+
+class Unprepared(Exception):
+    """A query with a statement that failed to compile, which is not cached."""
+
+    def __init__(self, statements: Tuple[Optional[Statement], ...]) -> None:
+        super().__init__()
+        self.statements = statements
+
+@functools.lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile_query(query: str, parser: str) -> Tuple[Optional[Statement], ...]:
+    tokens = tokenise.tokenise(query)
+    if parser == "packrat":
+        trees = reg_parse.parse_script(tokens)
+    else:
+        trees = [parse.parse(statement) for statement in parse.split_statements(tokens)]
+    statements = tuple(interpret.make_statement(tree) for tree in trees)
+    if None in statements:
+        raise Unprepared(statements)
+    return statements
+
+def prepare(query: str, parser: Optional[str] = None) -> Tuple[Optional[Statement], ...]:
+    """Compile each `;`-separated statement in `query`, caching the plans by query text.
+
+    Statements are parsed with `parser`, or `PARSER` by default. Queries that fail to compile are
+    compiled again each time, so their errors are logged again.
+    """
+    try:
+        return compile_query(query, parser or PARSER)
+    except Unprepared as failed:
+        return failed.statements
+
 def run(query: str, database: Dict[str, Table]) -> Optional[Table]:
-    parsed = parse.parse(query)
-    if parsed:
-        return select(interpret.make_select(parsed), database)
-    return None
+    """Run each statement in `query`, returning the result of the last."""
+    result = None
+    for statement in prepare(query):
+        result = select(statement, database)
+    return result
 
 
-def sort_order(array: List[Any], order: List[int]) -> List[Any]:
-    return [array[x] for x in order]
+def stream(statement: Optional[Statement], database: Dict[str, Table],
+           budget: Optional[memory.Budget] = None) -> Optional[Tuple[List[str], Iterator[Row]]]:
+    """Run select style command on database, producing rows lazily where the plan allows.
 
-def select(statement: Optional[Select], database: Dict[str, Table]) -> Optional[Table]:
-    """Run select style command on database."""
+    Operators that run as the rows are consumed raise `memory.MemoryBudgetExceeded` to the
+    consumer if they exceed the budget.
+    """
     if not statement:
         return None
-    table = database.get(statement.table)
-    if not table:
-        log.error(f"Table `{statement.table}` not found")
+    if isinstance(statement, CreateView):
+        view = views.create(statement, database)
+        if view is None:
+            return None
+        return ["view", "rows"], iter([(statement.name, str(len(view.rows)))])
+    if isinstance(statement, Explain):
+        return explain(statement, database)
+    compiled = plan(statement, database, budget=budget)
+    if not compiled:
         return None
-    columns = statement.columns if statement.columns != "*" else table.columns
-    log.debug("col %s", columns)
+    views.report(statement.table, database)
     try:
-        column_idx = [table.columns.index(column) for column in columns]
-    except ValueError as err:
-        log.error(f"Column named `{str(err).split()[0][1:-1]}` cannot be found.")
+        return compiled.columns, compiled.run(compiled.scan())
+    except memory.MemoryBudgetExceeded as err:
+        log.error(str(err))
+        return None
+
+def explain(statement: Explain, database: Dict[str, Table]) -> Optional[Tuple[List[str], Iterator[Row]]]:
+    """Describe the steps chosen for a select, with their estimated rows and costs."""
+    compiled = plan(statement.select, database)
+    if not compiled:
         return None
-    rows = [[row[idx] for idx in column_idx] for row in table.rows]
-    if statement.order:
-        rows.sort(key=lambda x: x[statement.order[0]])
-    if statement.distinct:
-        deduped_rows = []
-        last = None
-        for cell in rows:
-            if not last or cell != last:
-                deduped_rows.append(cell)
-                last = cell
-        rows = deduped_rows
-    if statement.limit:
-        rows = rows[:statement.limit]
-    return Table(columns, rows)
+    steps = [(step.operation, step.detail, str(round(step.rows)), str(round(step.cost)))
+             for step in compiled.steps]
+    total = sum(step.cost for step in compiled.steps)
+    steps.append(("total", "", str(round(compiled.steps[-1].rows)), str(round(total))))
+    return ["step", "detail", "rows", "cost"], iter(steps)
+
+def select(statement: Optional[Statement], database: Dict[str, Table],
+           budget: Optional[memory.Budget] = None) -> Optional[Table]:
+    """Run select style command on database."""
+    budget = budget or memory.Budget()
+    result = stream(statement, database, budget)
+    if not result:
+        return None
+    columns, rows = result
+    try:
+        return Table(columns, list(memory.retain(rows, budget, "The result")))
+    except memory.MemoryBudgetExceeded as err:
+        log.error(str(err))
+        return None
+
+class SharedScan:
+    """Collects the rows one plan needs from a scan shared with other plans.
+
+    Rows are projected as they are collected, and fed to the plan's sort, top-k heap or DISTINCT
+    as they arrive, so the plan holds no more than it would scanning the table alone.
+    """
+
+    def __init__(self, compiled: Plan) -> None:
+        statement = compiled.statement
+        self.plan = compiled
+        self.rows: List[Row] = []
+        self.seen: Set[Row] = set()
+        self.failed = False
+        # Aggregates are accumulated as the rows are scanned, rather than collected.
+        self.accumulators = compiled.start() if compiled.aggregates else None
+        # Ordered rows are collected with their sort key after the projected columns.
+        self.width = len(compiled.columns)
+        sort_key = operator.itemgetter(slice(self.width, None))
+        self.ordered: Optional[Union[DistinctSorter, memory.TopK, memory.Sorter]] = None
+        if compiled.distinct_first:
+            self.ordered = DistinctSorter(compiled.project, compiled.order_key,  # type: ignore
+                                          statement.descending, compiled.budget)
+        elif compiled.order_key and compiled.top_k is not None:
+            self.ordered = memory.TopK(compiled.top_k, sort_key, statement.descending,
+                                       compiled.budget)
+        elif compiled.order_key:
+            self.ordered = memory.Sorter(sort_key, statement.descending, compiled.budget)
+        # Without an ORDER BY, the scan can stop once enough rows have been collected.
+        self.needed: Optional[int] = None
+        if not statement.order and statement.limit is not None and not compiled.aggregates:
+            self.needed = statement.offset + statement.limit
+
+    def add(self, row: Row) -> bool:
+        """Offer a row to the plan, returning whether it needs no more rows."""
+        if self.plan.predicate and not self.plan.predicate(row):
+            return False
+        try:
+            return self.collect(row)
+        except memory.MemoryBudgetExceeded as err:
+            log.error(str(err))
+            self.failed = True
+            return True
+
+    def collect(self, row: Row) -> bool:
+        if self.accumulators is not None:
+            self.plan.accumulate(self.accumulators, row)
+            return False
+        if isinstance(self.ordered, DistinctSorter):
+            self.ordered.add(row)
+            return False
+        projected = self.plan.project(row)  # type: ignore
+        if self.ordered:
+            self.ordered.add(projected + self.plan.order_key(row))  # type: ignore
+            return False
+        if self.plan.statement.distinct:
+            if projected in self.seen:
+                return False
+            self.plan.budget.allocate(memory.row_size(projected), "DISTINCT")
+            self.seen.add(projected)
+        self.plan.budget.allocate(memory.row_size(projected), "The shared scan")
+        self.rows.append(projected)
+        return self.needed is not None and len(self.rows) >= self.needed
+
+    @property
+    def active(self) -> bool:
+        return not self.failed and (self.needed is None or len(self.rows) < self.needed)
+
+    def result(self) -> Optional[Table]:
+        if self.failed:
+            return None
+        if self.accumulators is not None:
+            rows = self.plan.window(iter([self.plan.finish(self.accumulators)]))
+            return Table(self.plan.columns, list(rows))
+        try:
+            if isinstance(self.ordered, DistinctSorter):
+                rows = self.ordered.result()
+            elif self.ordered:
+                rows = (row[:self.width] for row in self.ordered.result())
+                if self.plan.statement.distinct:
+                    rows = memory.dedupe(rows, self.plan.budget)
+            else:
+                rows = iter(self.rows)
+            return Table(self.plan.columns, list(self.plan.window(rows)))
+        except memory.MemoryBudgetExceeded as err:
+            log.error(str(err))
+            return None
+
+def select_many(statements: List[Optional[Statement]], database: Dict[str, Table],
+                budgets: Optional[List[memory.Budget]] = None) -> List[Optional[Table]]:
+    """Run several statements, reading each table once for all the selects over it.
+
+    Each statement may be given its own memory budget.
+    """
+    results: List[Optional[Table]] = [None] * len(statements)
+    budgets = budgets or [memory.Budget() for _ in statements]
+    # Sampled selects share a scan only with selects taking the same sample.
+    groups: Dict[Tuple[int, Optional[float]], List[Tuple[int, SharedScan]]] = {}
+    for i, statement in enumerate(statements):
+        if not isinstance(statement, Select):
+            results[i] = select(statement, database, budgets[i])
+            continue
+        compiled = plan(statement, database, budget=budgets[i])
+        if not compiled:
+            continue
+        views.report(statement.table, database)
+        if compiled.lookup:
+            # An index lookup reads fewer rows than a shared scan would.
+            try:
+                rows = memory.retain(compiled.run(compiled.scan()), budgets[i], "The result")
+                results[i] = Table(compiled.columns, list(rows))
+            except memory.MemoryBudgetExceeded as err:
+                log.error(str(err))
+        else:
+            groups.setdefault((id(compiled.table), statement.sample), []).append((i, SharedScan(compiled)))
+    for group in groups.values():
+        active = [shared for _, shared in group if shared.active]
+        for row in group[0][1].plan.scan() if active else ():
+            finished = False
+            for shared in active:
+                finished = shared.add(row) or finished
+            if finished:
+                active = [shared for shared in active if shared.active]
+                if not active:
+                    break
+        log.info(f"Answered {len(group)} queries with one scan of `{group[0][1].plan.statement.table}`.")
+        for i, shared in group:
+            results[i] = shared.result()
+    return results
@@ -0,0 +1,63 @@
+"""Evaluate WHERE conditions against rows."""
+
+from typing import Callable, Dict, List, Optional
+
+import logging
+import operator
+
+from .database import Row
+from .transactions import Condition
+
+log = logging.getLogger(__name__)
+
+Predicate = Callable[[Row], bool]
+
+COMPARISONS: Dict[str, Callable[[object, object], bool]] = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<>": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+}
+
+
+def number(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def make_comparison(idx: int, condition: Condition) -> Predicate:
+    """Compare a column to a value, numerically when both are numbers."""
+    compare = COMPARISONS[condition.operator]
+    value = condition.value
+    value_number = number(value)
+
+    def predicate(row: Row) -> bool:
+        cell = row[idx]
+        if value_number is not None:
+            cell_number = number(cell)
+            if cell_number is not None:
+                return compare(cell_number, value_number)
+        return compare(cell, value)
+
+    return predicate
+
+
+def make_predicate(columns: List[str], conditions: List[Condition]) -> Optional[Predicate]:
+    """Combine conditions into one predicate over rows with the given columns."""
+    comparisons = []
+    for condition in conditions:
+        if condition.operator not in COMPARISONS:
+            log.error(f"`{condition.operator}` is not a valid comparison.")
+            return None
+        if condition.column not in columns:
+            log.error(f"Column named `{condition.column}` cannot be found.")
+            return None
+        comparisons.append(make_comparison(columns.index(condition.column), condition))
+    if len(comparisons) == 1:
+        return comparisons[0]
+    return lambda row: all(comparison(row) for comparison in comparisons)
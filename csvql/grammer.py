@@ -9,29 +9,33 @@ from typing_extensions import Literal
 from csvql import tools
 
 PrimaryClause = Literal[
-    "select", "update", "insert", "delete"
+    "select", "update", "insert", "delete", "create materialized view", "explain"
 ]
 
 SecondaryClause = Literal[
-    "where", "from", "group by", "order by", "join", "limit"
+    "where", "from", "group by", "order by", "join", "limit", "as",
+    "offset", "fetch first", "fetch next", "tablesample"
 ]
 
 Aggregate = Literal[
-    "count", "range", "sum"
+    "count", "range", "sum", "approx_count_distinct", "approx_quantile"
 ]
 
 Prefix = Literal["distinct", "inner", "cross"]
 
-Postfix = Literal["asc", "desc"]
+# Postfixes of a number, which are keywords only directly after one, so columns can be named `rows`.
+NumberPostfix = Literal["rows only", "row only", "rows", "row", "percent"]
+
+Postfix = Literal["asc", "desc", NumberPostfix]
 
 Clause = Literal[PrimaryClause, SecondaryClause]
 
 Keyword = Literal[Clause, Aggregate, Prefix, Postfix]
 
-Operator = Literal["+"]
+Operator = Literal["<=", ">=", "<>", "!=", "=", "<", ">", "+"]
 
 ExprType = Literal[
-    "condition", "column-list", "table-name", "number", "none"
+    "condition", "column-list", "table-name", "number", "statement", "none"
 ]
 
 
@@ -40,6 +44,7 @@ CLAUSE = tools.extract_literals(Clause) # type: ignore
 AGGREGATE = tools.extract_literals(Aggregate) # type: ignore
 PREFIX = tools.extract_literals(Prefix) # type: ignore
 POSTFIX = tools.extract_literals(Postfix) # type: ignore
+NUMBER_POSTFIX = tools.extract_literals(NumberPostfix) # type: ignore
 KEYWORDS = tools.extract_literals(Keyword) # type: ignore
 OPERATORS = tools.extract_literals(Operator) # type: ignore
 
@@ -63,11 +68,23 @@ TYPES: List[Form] = [
         infix_flags=["distinct"],
         expression="column-list",
         required_clauses=["from"],
-        optional_clauses=["order by", "limit"]
+        optional_clauses=["tablesample", "where", "order by", "offset", "fetch first", "fetch next", "limit"]
     ),
     Form("limit", expression="number"),
-    Form("where"),
+    Form("offset", expression="number", postfix_flags=["rows", "row"]),
+    Form("fetch first", expression="number", postfix_flags=["rows only", "row only"]),
+    Form("fetch next", expression="number", postfix_flags=["rows only", "row only"]),
+    Form("where", expression="condition"),
+    Form("tablesample", expression="number", postfix_flags=["percent"]),
     Form("join", expression="none", prefix_flags=["inner"]),
     Form("from", "table-name"),
-    Form("order by", "column-list", postfix_flags=["asc", "desc"])
+    Form("order by", "column-list", postfix_flags=["asc", "desc"]),
+    Form(
+        "create materialized view",
+        primary=True,
+        expression="table-name",
+        required_clauses=["as"]
+    ),
+    Form("as", "statement"),
+    Form("explain", "statement", primary=True)
 ]
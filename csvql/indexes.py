@@ -0,0 +1,95 @@
+"""Hash indexes for equality lookups, built by the planner when it expects them to pay off.
+
+An index maps each value of a column to the positions of the rows holding it. Values are keyed
+as the filters compare them, numerically when they are numbers, so a lookup finds exactly the rows
+an `=` comparison would. Indexes catch up with appended rows when used, and are dropped when their
+table is reloaded or when they are not among the `MAX_INDEXES` used most recently.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import collections
+import itertools
+import logging
+import threading
+
+from . import database
+from .database import Table, Row
+from .filters import number
+
+log = logging.getLogger(__name__)
+
+MAX_INDEXES = 64
+# The memory held by an index for each row: the row's position, and a reference to it.
+ENTRY_SIZE = 36
+
+
+def index_key(value: str) -> Any:
+    value_number = number(value)
+    return value if value_number is None else value_number
+
+
+class HashIndex:
+    """The positions of the rows of `table` holding each value of one column."""
+
+    def __init__(self, table: Table, idx: int) -> None:
+        self.table = table
+        self.idx = idx
+        self.rows = 0
+        self.positions: Dict[Any, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def catch_up(self) -> None:
+        with self._lock:
+            end = len(self.table.rows)
+            for position, row in enumerate(itertools.islice(self.table.rows, self.rows, end),
+                                           self.rows):
+                self.positions.setdefault(index_key(row[self.idx]), []).append(position)
+            self.rows = end
+
+    def lookup(self, value: str, rows: int) -> Iterator[Row]:
+        """Yield the rows among the first `rows` whose column equals `value`, in table order."""
+        self.catch_up()
+        table_rows = self.table.rows
+        for position in self.positions.get(index_key(value), []):
+            if position >= rows:
+                break
+            yield table_rows[position]
+
+
+def index_size(rows: float) -> int:
+    """Estimate the memory needed to index `rows` rows."""
+    return int(rows * ENTRY_SIZE)
+
+
+# Keyed by table id and column, in order of use. The tables are held by their indexes, so their
+# ids are not reused while they have an entry.
+INDEXES: "collections.OrderedDict[Tuple[int, int], HashIndex]" = collections.OrderedDict()
+BUILDING = threading.Lock()
+
+
+def find(table: Table, idx: int) -> Optional[HashIndex]:
+    return INDEXES.get((id(table), idx))
+
+
+def build(table: Table, idx: int) -> HashIndex:
+    with BUILDING:
+        index = find(table, idx)
+        if index is None:
+            index = INDEXES[(id(table), idx)] = HashIndex(table, idx)
+            index.catch_up()
+            log.info(f"Built an index on `{table.columns[idx]}` over {index.rows} rows.")
+        INDEXES.move_to_end((id(table), idx))
+        while len(INDEXES) > MAX_INDEXES:
+            INDEXES.popitem(last=False)
+    return index
+
+
+def discard(table: Table, appended: Optional[List[Row]]) -> None:
+    """Drop the indexes of a reloaded table; appended rows are caught up with lazily."""
+    if appended is None:
+        with BUILDING:
+            for key in [key for key, index in INDEXES.items() if index.table is table]:
+                del INDEXES[key]
+
+database.REFRESH_HOOKS.append(discard)
@@ -1,26 +1,113 @@
 """Interpret a SQL AST as command to be run."""
 
-from typing import Optional, Union, List
+from typing import Dict, Optional, Union, List
+
+import logging
 
 from typing_extensions import Literal
 
-from .parse import Clause
-from .transactions import Select
+from .parse import Clause, Call
+from .transactions import Select, CreateView, Explain, Statement, Condition, Aggregate
+
+log = logging.getLogger(__name__)
+
+
+# Number of arguments taken by each aggregate function.
+ARITY = {"approx_quantile": 2}
+
+
+def make_aggregate(call: Call) -> Optional[Aggregate]:
+    arity = ARITY.get(call.function, 1)
+    if len(call.arguments) != arity:
+        log.error(f"`{call.function}` takes {arity} argument{'s' if arity > 1 else ''}, "
+                  f"but got {len(call.arguments)}.")
+        return None
+    argument = call.arguments[1] if arity > 1 else None
+    if argument is not None and not (argument.isdigit() and int(argument) <= 100):
+        log.error(f"`{call.function}` needs a percentile between 0 and 100.")
+        return None
+    return Aggregate(call.function, call.arguments[0], "distinct" in call.flags, argument)
+
+
+def make_number(clause: Clause) -> Optional[int]:
+    """Read the whole number taken by a clause such as LIMIT."""
+    if not (isinstance(clause.expression, str) and clause.expression.isdigit()):
+        log.error(f"`{clause.form.name}` takes a number, not `{clause.expression}`.")
+        return None
+    return int(clause.expression)
 
 
 def make_select(statement: Optional[Clause]) -> Optional[Select]:
     if not statement:
         return None
-    distinct: bool = statement.flags and "distinct" in statement.flags
-    columns: Union[List[str], Literal["*"]] = statement.expression
+    distinct: bool = bool(statement.flags) and "distinct" in statement.flags
+    columns: Union[List[Union[str, Aggregate]], Literal["*"]] = statement.expression
+    if columns != "*":
+        columns = [
+            make_aggregate(column) if isinstance(column, Call) else column
+            for column in statement.expression
+        ]
+        if None in columns:
+            return None
     table: str = statement.children['from'].expression
-    limit: Optional[int]
+    descending = False
     if 'order by' in statement.children:
         order = statement.children['order by'].expression
+        descending = "desc" in statement.children['order by'].flags
     else:
         order = None
-    if 'limit' in statement.children:
-        limit = int(statement.children['limit'].expression)
-    else:
-        limit = None
-    return Select(distinct, columns, order, table, limit)
+    counts: Dict[str, int] = {}
+    for name in ('limit', 'fetch first', 'fetch next', 'offset'):
+        if name in statement.children:
+            count = make_number(statement.children[name])
+            if count is None:
+                return None
+            counts[name] = count
+    offset = counts.pop('offset', 0)
+    limit = min(counts.values()) if counts else None
+    where: List[Condition] = []
+    if 'where' in statement.children:
+        where = [Condition(*comparison) for comparison in statement.children['where'].expression]
+    sample: Optional[float] = None
+    if 'tablesample' in statement.children:
+        sample = make_number(statement.children['tablesample'])
+        if sample is None:
+            return None
+        if not 0 < sample <= 100:
+            log.error(f"TABLESAMPLE must be a percentage between 0 and 100, not {sample:g}.")
+            return None
+    return Select(distinct, columns, order, table, limit, descending, offset, where, sample)
+
+
+def make_create_view(statement: Clause) -> Optional[CreateView]:
+    if statement.children['as'].expression.form.name != "select":
+        log.error("Only select statements can be materialized.")
+        return None
+    select = make_select(statement.children['as'].expression)
+    if not select:
+        return None
+    return CreateView(statement.expression, select)
+
+
+def make_explain(statement: Clause) -> Optional[Explain]:
+    if statement.expression.form.name != "select":
+        log.error("Only select statements can be explained.")
+        return None
+    select = make_select(statement.expression)
+    if not select:
+        return None
+    return Explain(select)
+
+
+def make_statement(statement: Optional[Clause]) -> Optional[Statement]:
+    """Interpret any primary clause as a statement."""
+    if not statement:
+        return None
+    if statement.form.name == "select":
+        return make_select(statement)
+    if statement.form.name == "create materialized view":
+        return make_create_view(statement)
+    if statement.form.name == "explain":
+        return make_explain(statement)
+    log.error(f"`{statement.form.name}` statements are not supported.")
+    return None
@@ -0,0 +1,313 @@
+"""Per-query memory budgets, and admission control against a global cap.
+
+Operators that hold rows allocate an estimate of their size from the query's `Budget`. Sorts
+spill sorted runs to temporary files when the budget is exhausted and merge them back; other
+operators fail cleanly by raising `MemoryBudgetExceeded`. A `Governor` admits queries only while
+the budgets it has reserved fit within its cap, queueing the rest in arrival order, and refuses
+those with budgets larger than the cap.
+"""
+
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+import collections
+import contextlib
+import heapq
+import itertools
+import logging
+import pickle
+import re
+import sys
+import tempfile
+import threading
+
+from .database import Row
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUDGET = 256 * 1024 ** 2
+DEFAULT_CAP = 1024 ** 3
+QUEUE_TIMEOUT = 30.0
+# The size of a reference to a row, held in a list, set or dict.
+POINTER_SIZE = 8
+
+UNITS = {"": 1, "b": 1, "k": 1000, "kb": 1000, "kib": 1024, "m": 1000 ** 2, "mb": 1000 ** 2,
+         "mib": 1024 ** 2, "g": 1000 ** 3, "gb": 1000 ** 3, "gib": 1024 ** 3}
+SIZE = re.compile(r"^\s*(?P<number>\d+(\.\d+)?)\s*(?P<unit>[a-z]*)\s*$", re.IGNORECASE)
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """A query needed more memory than its budget allows."""
+
+
+def parse_size(size: str) -> Optional[int]:
+    """Read a size such as `512MiB`, `2GB` or `1000000`, in bytes."""
+    match = SIZE.match(size)
+    if not match or match["unit"].lower() not in UNITS:
+        log.error(f"`{size}` is not a memory size, such as `512MiB`.")
+        return None
+    return int(float(match["number"]) * UNITS[match["unit"].lower()])
+
+
+def format_size(size: float) -> str:
+    for unit in ["B", "KiB", "MiB"]:
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def row_size(row: Any) -> int:
+    """Estimate the memory held by one stored row, not counting values shared with the table."""
+    return sys.getsizeof(row) + POINTER_SIZE
+
+
+class Budget:
+    """The memory a query may use, and the most it has used at once."""
+
+    def __init__(self, limit: Optional[int] = None) -> None:
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.spilled = 0
+
+    def try_allocate(self, size: int) -> bool:
+        """Allocate `size` bytes if they fit in the budget, returning whether they did."""
+        if self.limit is not None and self.used + size > self.limit:
+            return False
+        self.used += size
+        self.peak = max(self.peak, self.used)
+        return True
+
+    def fits(self, size: float) -> bool:
+        return self.limit is None or self.used + size <= self.limit
+
+    def allocate(self, size: int, operation: str) -> None:
+        if not self.try_allocate(size):
+            raise MemoryBudgetExceeded(
+                f"{operation} needs more than the query's memory budget of "
+                f"{format_size(self.limit or 0)}.")
+
+    def release(self, size: int) -> None:
+        self.used -= size
+
+    def report(self, name: str = "Query") -> None:
+        """Log the query's peak memory use."""
+        limit = "" if self.limit is None else f" of its {format_size(self.limit)} budget"
+        spilled = f", and spilled {self.spilled} rows to disk" if self.spilled else ""
+        log.info(f"{name} used at most {format_size(self.peak)}{limit}{spilled}.")
+
+
+def retain(rows: Iterable[Row], budget: Budget, operation: str) -> Iterator[Row]:
+    """Allocate memory for rows as they are stored by the consumer, e.g. in a result list."""
+    for row in rows:
+        budget.allocate(row_size(row), operation)
+        yield row
+
+
+def dedupe(rows: Iterable[Row], budget: Budget) -> Iterator[Row]:
+    """Drop repeated rows, keeping the first occurrence of each."""
+    seen = set()
+    used = 0
+    try:
+        for row in rows:
+            if row not in seen:
+                size = row_size(row)
+                budget.allocate(size, "DISTINCT")
+                used += size
+                seen.add(row)
+                yield row
+    finally:
+        budget.release(used)
+
+
+def spill(rows: List[Row]) -> Any:
+    """Write rows to a temporary file, to be read back by `unspill`."""
+    handle = tempfile.TemporaryFile()
+    for batch in range(0, len(rows), 1024):
+        pickle.dump(rows[batch:batch + 1024], handle, pickle.HIGHEST_PROTOCOL)
+    handle.seek(0)
+    return handle
+
+
+def unspill(handle: Any) -> Iterator[Row]:
+    with handle:
+        while True:
+            try:
+                batch = pickle.load(handle)
+            except EOFError:
+                return
+            yield from batch
+
+
+class Sorter:
+    """Sort rows as they are added, spilling sorted runs to disk whenever the budget is exhausted.
+
+    Runs are read back and merged, earlier runs first among equal keys, so the result is the same
+    as `sorted`.
+    """
+
+    def __init__(self, key: Callable[[Row], Any], reverse: bool, budget: Budget) -> None:
+        self.key = key
+        self.reverse = reverse
+        self.budget = budget
+        self.runs: List[Any] = []
+        self.chunk: List[Row] = []
+        self.used = 0
+
+    def add(self, row: Row) -> None:
+        size = row_size(row) + row_size(self.key(row))
+        if not self.budget.try_allocate(size):
+            if not self.chunk:
+                self.budget.allocate(size, "ORDER BY")
+            self.chunk.sort(key=self.key, reverse=self.reverse)
+            self.runs.append(spill(self.chunk))
+            self.budget.spilled += len(self.chunk)
+            self.budget.release(self.used)
+            self.chunk, self.used = [], 0
+            self.budget.allocate(size, "ORDER BY")
+        self.chunk.append(row)
+        self.used += size
+
+    def result(self) -> Iterator[Row]:
+        self.chunk.sort(key=self.key, reverse=self.reverse)
+        if self.runs:
+            log.debug(f"Sort spilled {len(self.runs)} runs to disk.")
+            self.runs.append(spill(self.chunk))
+            self.budget.spilled += len(self.chunk)
+            self.budget.release(self.used)
+            return heapq.merge(*map(unspill, self.runs), key=self.key, reverse=self.reverse)
+        return release_after(self.chunk, self.used, self.budget)
+
+
+def sort(rows: Iterable[Row], key: Callable[[Row], Any], reverse: bool,
+         budget: Budget) -> Iterator[Row]:
+    """Sort rows stably with a `Sorter`, which may spill."""
+    sorter = Sorter(key, reverse, budget)
+    for row in rows:
+        sorter.add(row)
+    return sorter.result()
+
+
+class TopK:
+    """Keep the first `k` rows in sorted order as they are added, as `sorted(rows)[:k]` would.
+
+    Up to `2 * k` rows are kept, and pruned back to the first `k` whenever that many have been
+    added, if they would fit in the budget judging by the first row. Otherwise the rows are
+    sorted by a `Sorter`, which may spill.
+    """
+
+    def __init__(self, k: int, key: Callable[[Row], Any], reverse: bool, budget: Budget) -> None:
+        self.k = k
+        self.key = key
+        self.reverse = reverse
+        self.budget = budget
+        self.kept: List[Row] = []
+        self.used = 0
+        self.sorter: Optional[Sorter] = None
+        self.started = False
+
+    def add(self, row: Row) -> None:
+        if not self.started:
+            self.started = True
+            if not self.budget.fits(2 * self.k * (row_size(row) + row_size(self.key(row)))):
+                self.sorter = Sorter(self.key, self.reverse, self.budget)
+        if self.sorter:
+            self.sorter.add(row)
+            return
+        if not self.k:
+            return
+        size = row_size(row) + row_size(self.key(row))
+        self.budget.allocate(size, "ORDER BY with LIMIT")
+        self.used += size
+        self.kept.append(row)
+        if len(self.kept) >= 2 * self.k:
+            self.prune()
+
+    def prune(self) -> None:
+        select = heapq.nlargest if self.reverse else heapq.nsmallest
+        self.kept = select(self.k, self.kept, key=self.key)
+        used = sum(row_size(row) + row_size(self.key(row)) for row in self.kept)
+        self.budget.release(self.used - used)
+        self.used = used
+
+    def result(self) -> Iterator[Row]:
+        if self.sorter:
+            return itertools.islice(self.sorter.result(), self.k)
+        self.prune()
+        return release_after(self.kept, self.used, self.budget)
+
+
+def top(rows: Iterable[Row], k: int, key: Callable[[Row], Any], reverse: bool,
+        budget: Budget) -> Iterator[Row]:
+    """Yield the first `k` rows in sorted order with a `TopK`."""
+    first_k = TopK(k, key, reverse, budget)
+    for row in rows:
+        first_k.add(row)
+    return first_k.result()
+
+
+def release_after(rows: Iterable[Row], size: int, budget: Budget) -> Iterator[Row]:
+    try:
+        yield from rows
+    finally:
+        budget.release(size)
+
+
+class Governor:
+    """Admit queries while their reserved budgets fit within `cap` bytes, queueing the rest."""
+
+    def __init__(self, cap: int = DEFAULT_CAP, timeout: float = QUEUE_TIMEOUT) -> None:
+        self.cap = cap
+        self.timeout = timeout
+        self.reserved = 0
+        self._waiting: "collections.deque[int]" = collections.deque()
+        self._tickets = itertools.count()
+        self._condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def admit(self, size: Optional[int]) -> Iterator[None]:
+        """Reserve `size` bytes while a request runs, see `reserve`."""
+        release = self.reserve(size)
+        try:
+            yield
+        finally:
+            release()
+
+    def reserve(self, size: Optional[int]) -> Callable[..., None]:
+        """Reserve `size` bytes, waiting for other requests to release them, and return a function
+        releasing them again.
+
+        Requests without a limit reserve the whole cap, and those needing more than the cap are
+        refused. The function releases all but its `keep` argument's bytes, and all of them by
+        default, so a suspended request can keep reserved only what it still holds.
+        """
+        if size is not None and size > self.cap:
+            raise MemoryBudgetExceeded(f"{format_size(size)} is more memory than the server's cap "
+                                       f"of {format_size(self.cap)}.")
+        size = self.cap if size is None else size
+        with self._condition:
+            ticket = next(self._tickets)
+            self._waiting.append(ticket)
+            if self._waiting[0] != ticket or self.reserved + size > self.cap:
+                log.info(f"Waiting for {format_size(size)} of memory, with "
+                         f"{len(self._waiting) - 1} requests ahead.")
+            admitted = self._condition.wait_for(
+                lambda: self._waiting[0] == ticket and self.reserved + size <= self.cap,
+                self.timeout)
+            self._waiting.remove(ticket)
+            self._condition.notify_all()
+            if not admitted:
+                raise MemoryBudgetExceeded(
+                    f"Timed out after {self.timeout:g}s waiting for {format_size(size)} of memory.")
+            self.reserved += size
+        held = size
+
+        def release(keep: int = 0) -> None:
+            nonlocal held
+            with self._condition:
+                if keep < held:
+                    self.reserved -= held - keep
+                    held = keep
+                    self._condition.notify_all()
+
+        return release
@@ -15,7 +15,7 @@ from csvql import grammer
 from csvql.grammer import Form, Keyword
 from .tools import Smariter
 
-from .tokenise import Token
+from .tokenise import Token, KEYWORD_LABELS
 
 log = logging.getLogger(__name__)
 
@@ -29,6 +29,14 @@ class Clause:
     children: Dict[Keyword, 'Clause']
 
 
+@dataclass
+class Call:
+    """An aggregate function call in a column list."""
+    function: Keyword
+    flags: Set[Keyword]
+    arguments: List[str]
+
+
 def get_form(value: str) -> Optional[Form]:
     for x in grammer.TYPES:
         if value == x.name:
@@ -36,6 +44,66 @@ def get_form(value: str) -> Optional[Form]:
     return None
 
 
+def is_keyword(token: Optional[Token]) -> bool:
+    return token is not None and token.label in KEYWORD_LABELS
+
+
+def parse_call(token_iter: Any) -> Optional[Call]:
+    """Parse `function([distinct] argument, ...)`."""
+    function = token_iter.value().value
+    next(token_iter, None)
+    if not token_iter.value() or token_iter.value().label != "left":
+        log.error(f"Expected `(` after `{function}`.")
+        return None
+    next(token_iter, None)
+    flags: Set[Keyword] = set()
+    arguments: List[str] = []
+    while True:
+        token = token_iter.value()
+        if token is None:
+            log.error(f"Expected `)` to close `{function}`.")
+            return None
+        if token.label == "right":
+            next(token_iter, None)
+            return Call(function, flags, arguments)
+        if token.label == "prefix" and token.value == "distinct" and not arguments:
+            flags.add(token.value)
+        elif token.label in ("word", "asterisk", "number"):
+            arguments.append(token.value)
+        elif token.label != "comma":
+            log.error(f"Unexpected `{token.value}` in `{function}`.")
+            return None
+        next(token_iter, None)
+
+
+def parse_condition(token_iter: Any) -> Optional[List[List[str]]]:
+    """Parse `column operator value` comparisons joined by `and`."""
+    tokens: List[Token] = []
+    while token_iter.value() and not is_keyword(token_iter.value()) \
+            and token_iter.value().label != "semicolon":
+        tokens.append(token_iter.value())
+        next(token_iter, None)
+    comparisons = []
+    for i in range(0, len(tokens), 4):
+        comparison = tokens[i:i+3]
+        if len(comparison) != 3 or comparison[1].label != "operator" \
+                or comparison[0].label != "word":
+            log.error(f"Expected `column operator value`, but got "
+                      f"`{' '.join(token.value for token in comparison)}`.")
+            return None
+        if i + 3 < len(tokens) and tokens[i + 3].value.lower() != "and":
+            log.error(f"Expected `and` between conditions, but got `{tokens[i + 3].value}`.")
+            return None
+        comparisons.append([token.value for token in comparison])
+    if tokens and len(tokens) % 4 == 0:
+        log.error("Expected a condition after `and`.")
+        return None
+    if not comparisons:
+        log.error("Expected a condition.")
+        return None
+    return comparisons
+
+
 def parse_query(token_iter: Any) -> Optional[Clause]:
     messages = []
     flags: Set[Keyword] = set()
@@ -50,7 +118,7 @@ def parse_query(token_iter: Any) -> Optional[Clause]:
         log.error("No tokens to consume.")
         return None
     first_token = token_iter.value()
-    if not first_token.label == "keyword":
+    if not is_keyword(first_token):
         log.error(f"Expected keyword, but got `{first_token.value}`.")
         return None
     first_form = get_form(first_token.value)
@@ -71,32 +139,49 @@ def parse_query(token_iter: Any) -> Optional[Clause]:
             form = second_form
     else:
         form = first_form
-    next(token_iter)
+    next(token_iter, None)
     # ---
-    if token_iter.value().label == "keyword":
+    if is_keyword(token_iter.value()):
         if token_iter.value().value in form.infix_flags:
             flags.add(token_iter.value().value)
-            next(token_iter)
+            next(token_iter, None)
     # ---
     #return Result([f"Form: {form} {token_iter.value()}"])
-    if form.expression == "table-name":
-        expression = token_iter.value().value
-        token = next(token_iter)
-    elif form.expression == "number":
+    if form.expression in ("table-name", "number"):
+        if not token_iter.value() or is_keyword(token_iter.value()):
+            log.error(f"Expected {form.expression} after `{form.name}`.")
+            return None
         expression = token_iter.value().value
-        token = next(token_iter)
+        next(token_iter, None)
+    elif form.expression == "condition":
+        expression = parse_condition(token_iter)
+        if expression is None:
+            return None
+    elif form.expression == "statement":
+        expression = parse_query(token_iter)
+        if expression is None:
+            return None
+        if not expression.form.primary:
+            log.error(f"Expected a statement after `{form.name}`, but got `{expression.form.name}`.")
+            return None
     elif form.expression == "column-list":
         # print("bnag", token_iter.value())
-        if token_iter.value().value == "*":
+        if token_iter.value() and token_iter.value().value == "*":
             # print("Star found!")
             expression = "*"
-            token = next(token_iter)
+            next(token_iter, None)
         else:
             expression = []
             # for token in token_iter:
             while True:
                 token = token_iter.value()
-                if token_iter.value().label == "keyword":
+                if token is not None and token.label == "aggregate":
+                    call = parse_call(token_iter)
+                    if call is None:
+                        return None
+                    expression.append(call)
+                    continue
+                if token is None or is_keyword(token) or token.label == "semicolon":
                     break
                 elif token.label == "operator" and token.value != ",":
                     log.error(f"`{token.value} is not a valid operator in column list.`")
@@ -104,14 +189,23 @@ def parse_query(token_iter: Any) -> Optional[Clause]:
                     pass
                 else:
                     expression.append(token.value)
-                next(token_iter)
+                next(token_iter, None)
+            if not expression:
+                log.error(f"Expected column list after `{form.name}`.")
+                return None
+    # ---
+    while is_keyword(token_iter.value()) and token_iter.value().value in form.postfix_flags:
+        flags.add(token_iter.value().value)
+        next(token_iter, None)
     # ---
     for x in form.required_clauses:
-        if token_iter.value().value != x:
+        if not token_iter.value() or token_iter.value().value != x:
             log.error(f"`{x}` clause required.")
+            return None
         result = parse_query(token_iter)
         if result is None:
             log.error("Recursive call failed.")
+            return None
         children.update({result.form.name: result})
     # ---
     for x in form.optional_clauses:
@@ -121,6 +215,7 @@ def parse_query(token_iter: Any) -> Optional[Clause]:
         result = parse_query(token_iter)
         if result is None:
             log.error("Recursive call failed.")
+            return None
         children.update({result.form.name: result})
 
     return Clause(form, flags, expression, children)
@@ -130,20 +225,34 @@ def parse(tokens: Optional[List[Token]]) -> Optional[Clause]:
     # Tokenise
     if not tokens:
         log.error("Error: No tokens to consume.")
+        return None
     #token_iter = look_ahead(iter(tokens))
     token_iter = Smariter(tokens)
     next(token_iter)
     result = parse_query(token_iter)
     if result and not result.form.primary:
         log.error(f"Error: Clause `{result.form.name}` is not primary.")
-    #remainder = list(x[0].value for x in list(token_iter))
-    #if remainder:
-    #    result.messages.append(f"Warning: Tokens {remainder} still remain.")
+        return None
+    remainder = [token.value for token in token_iter.remaining()]
+    if result and remainder:
+        log.error(f"Error: Unexpected tokens {remainder}.")
+        return None
     log.info(f"Parsed clause as {print_clause(result)}")
     log.info(f"Tokens are {list(x.value for x in tokens)}.")
     return result
 
 
+def split_statements(tokens: List[Token]) -> List[List[Token]]:
+    """Split a token list on semicolons, dropping empty statements."""
+    statements: List[List[Token]] = [[]]
+    for token in tokens:
+        if token.label == "semicolon":
+            statements.append([])
+        else:
+            statements[-1].append(token)
+    return [statement for statement in statements if statement]
+
+
 def print_clause(clause: Clause, depth: int = 2) -> str:
     if not clause:
         return ""
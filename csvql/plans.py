@@ -0,0 +1,312 @@
+"""Resolve select statements against tables, and choose how to run them over their rows.
+
+The planner estimates the rows and cost of each step from table statistics, counting a cost of
+one for each row read, compared or hashed. It chooses between a scan and a hash index lookup for
+equality conditions, and between sorting everything, a top-k heap, and de-duplicating before
+sorting for DISTINCT and ORDER BY. `EXPLAIN` shows the steps chosen with their estimates.
+"""
+
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import itertools
+import logging
+import math
+import random
+
+from . import aggregates, filters, indexes, memory, stats
+from .aggregates import Accumulator
+from .database import Table, Row, projector
+from .transactions import Aggregate, Condition, Select
+
+log = logging.getLogger(__name__)
+
+SAMPLE_RANDOM = random.Random()
+
+# Use an index for equality conditions expected to match at most this fraction of the rows.
+INDEX_SELECTIVITY = 0.1
+# The cost per comparison of a top-k heap, relative to a sort.
+HEAP_FACTOR = 2.0
+
+
+def sort_cost(rows: float) -> float:
+    return rows * math.log2(max(rows, 2))
+
+
+class DistinctSorter:
+    """De-duplicate rows as they are added and then sort them, giving the same rows as sorting and
+    then de-duplicating.
+
+    Each distinct row is ordered by the first of its rows in sorted order: the one with the
+    lowest key (or highest, descending), and of those the first in the table.
+    """
+
+    def __init__(self, project: Callable[[Row], Row], key: Callable[[Row], Row],
+                 descending: bool, budget: memory.Budget) -> None:
+        self.project = project
+        self.key = key
+        self.descending = descending
+        self.budget = budget
+        self.best: Dict[Row, tuple] = {}
+        self.position = 0
+
+    def add(self, row: Row) -> None:
+        projected = self.project(row)
+        row_key = self.key(row)
+        entry = self.best.get(projected)
+        if entry is None:
+            self.budget.allocate(memory.row_size(projected) + memory.row_size(row_key),
+                                 "DISTINCT")
+        if entry is None or (row_key > entry[0] if self.descending else row_key < entry[0]):
+            self.best[projected] = (row_key, self.position)
+        self.position += 1
+
+    def result(self) -> Iterator[Row]:
+        used = sum(memory.row_size(projected) + memory.row_size(entry[0])
+                   for projected, entry in self.best.items())
+        ordered = sorted(self.best.items(), key=lambda item: item[1][1])
+        ordered.sort(key=lambda item: item[1][0], reverse=self.descending)
+        return memory.release_after([projected for projected, _ in ordered], used, self.budget)
+
+
+def distinct_sorted(rows: Iterable[Row], project: Callable[[Row], Row],
+                    key: Callable[[Row], Row], descending: bool,
+                    budget: memory.Budget) -> Iterator[Row]:
+    """De-duplicate and then sort rows with a `DistinctSorter`."""
+    sorter = DistinctSorter(project, key, descending, budget)
+    for row in rows:
+        sorter.add(row)
+    return sorter.result()
+
+
+class Step(NamedTuple):
+    """A step of a plan, with the rows it is estimated to produce and its cost."""
+    operation: str
+    detail: str
+    rows: float
+    cost: float
+
+
+def column_indexes(table: Table, columns: List[str]) -> Optional[List[int]]:
+    try:
+        return [table.columns.index(column) for column in columns]
+    except ValueError as err:
+        log.error(f"Column named `{str(err).split()[0][1:-1]}` cannot be found.")
+        return None
+
+
+class Plan:
+    """A select statement resolved against the columns of its table."""
+
+    def __init__(self, statement: Select, table: Table, columns: List[str],
+                 column_idx: List[int], order_idx: List[int],
+                 predicate: Optional[filters.Predicate],
+                 aggregate_idx: Optional[List[Optional[int]]] = None,
+                 budget: Optional[memory.Budget] = None) -> None:
+        self.statement = statement
+        self.budget = budget or memory.Budget()
+        self.table = table
+        self.columns = columns
+        self.project = projector(column_idx) if column_idx else None
+        self.order_key = projector(order_idx) if order_idx else None
+        self.predicate = predicate
+        self.aggregates: List[Aggregate] = [
+            column for column in statement.columns if isinstance(column, Aggregate)
+        ] if statement.columns != "*" else []
+        self.aggregate_idx = aggregate_idx or []
+        self.row_count = len(table.rows)
+        self.sample_size = self.row_count
+        if statement.sample is not None and self.row_count:
+            self.sample_size = max(1, round(self.row_count * statement.sample / 100))
+        # Strategies chosen by `optimise`, and the steps it estimated.
+        self.lookup: Optional[Condition] = None
+        self.top_k: Optional[int] = None
+        self.distinct_first = False
+        self.steps: List[Step] = []
+
+    @property
+    def fraction(self) -> float:
+        """The fraction of the table's rows that are scanned."""
+        return self.sample_size / self.row_count if self.row_count else 1.0
+
+    def scan(self) -> Iterator[Row]:
+        """Read the table's rows, or a random sample of them in table order."""
+        # Only the rows present now are read, so results are consistent while the table is
+        # appended to.
+        rows = self.table.rows
+        if self.lookup:
+            idx = self.table.columns.index(self.lookup.column)
+            # The query that builds an index is charged for it while it runs.
+            size = 0 if indexes.find(self.table, idx) else indexes.index_size(len(rows))
+            self.budget.allocate(size, f"The index on `{self.lookup.column}`")
+            index = indexes.build(self.table, idx)
+            return memory.release_after(index.lookup(self.lookup.value, self.row_count), size,
+                                        self.budget)
+        if self.sample_size == self.row_count:
+            return itertools.islice(rows, self.row_count)
+        log.info(f"Sampled {self.sample_size} of {self.row_count} rows of `{self.statement.table}`.")
+        offsets = sorted(SAMPLE_RANDOM.sample(range(self.row_count), self.sample_size))
+        return (rows[offset] for offset in offsets)
+
+    def start(self) -> List[Accumulator]:
+        return [aggregates.accumulator(aggregate, self.fraction, self.sample_size, self.budget)
+                for aggregate in self.aggregates]
+
+    def accumulate(self, accumulators: List[Accumulator], row: Row) -> None:
+        for accumulator, idx in zip(accumulators, self.aggregate_idx):
+            accumulator.add(row[idx] if idx is not None else "")
+
+    def finish(self, accumulators: List[Accumulator]) -> Row:
+        """Produce the row of aggregate results, logging any error bounds."""
+        row = tuple(accumulator.result() for accumulator in accumulators)
+        for accumulator, value in zip(accumulators, row):
+            accumulator.report(value)
+        return row
+
+    def run(self, rows: Iterable[Row], filtered: bool = False) -> Iterator[Row]:
+        """Produce the statement's result from some of the table's rows, lazily where possible."""
+        statement = self.statement
+        if self.predicate and not filtered:
+            rows = filter(self.predicate, rows)
+        projected: Iterator[Row]
+        if self.aggregates:
+            accumulators = self.start()
+            for row in rows:
+                self.accumulate(accumulators, row)
+            projected = iter([self.finish(accumulators)])
+        elif self.distinct_first:
+            projected = distinct_sorted(rows, self.project, self.order_key,  # type: ignore
+                                        statement.descending, self.budget)
+        else:
+            if self.order_key and self.top_k is not None:
+                rows = memory.top(rows, self.top_k, self.order_key, statement.descending,
+                                  self.budget)
+            elif self.order_key:
+                rows = memory.sort(rows, self.order_key, statement.descending, self.budget)
+            projected = map(self.project, rows)  # type: ignore
+            if statement.distinct:
+                projected = memory.dedupe(projected, self.budget)
+        return self.window(projected)
+
+    def window(self, rows: Iterator[Row]) -> Iterator[Row]:
+        """Apply the statement's OFFSET and LIMIT to its result rows."""
+        statement = self.statement
+        if statement.offset or statement.limit is not None:
+            stop = None if statement.limit is None else statement.offset + statement.limit
+            rows = itertools.islice(rows, statement.offset, stop)
+        return rows
+
+
+def optimise(compiled: Plan) -> Plan:
+    """Choose how to run a plan, from the statistics of its table."""
+    statement = compiled.statement
+    table_stats = stats.table_stats(compiled.table)
+    steps = compiled.steps
+    rows = float(compiled.sample_size)
+    conditions = statement.where
+    lookups = [condition for condition in conditions if condition.operator == "="]
+    if lookups and statement.sample is None and rows:
+        # Prefer the most selective equality condition.
+        selectivities = [table_stats.selectivity([condition]) for condition in lookups]
+        best = min(range(len(lookups)), key=selectivities.__getitem__)
+        built = indexes.find(compiled.table, compiled.table.columns.index(lookups[best].column))
+        if selectivities[best] <= INDEX_SELECTIVITY and (
+                built or compiled.budget.fits(indexes.index_size(len(compiled.table.rows)))):
+            compiled.lookup = lookups[best]
+    if compiled.lookup:
+        lookup = compiled.lookup
+        matches = rows * table_stats.selectivity([lookup])
+        built = indexes.find(compiled.table, compiled.table.columns.index(lookup.column))
+        detail = f"{lookup.column} = {lookup.value}" + ("" if built else ", building the index")
+        steps.append(Step("index lookup", detail, matches, matches + (0 if built else rows)))
+        rows = matches
+        conditions = [condition for condition in conditions if condition is not lookup]
+    elif statement.sample is not None:
+        steps.append(Step("sample", f"{statement.sample:g}% of `{statement.table}`", rows, rows))
+    else:
+        steps.append(Step("scan", f"`{statement.table}`", rows, rows))
+    if conditions:
+        filtered = rows * table_stats.selectivity(conditions)
+        detail = " and ".join(" ".join(condition) for condition in conditions)
+        steps.append(Step("filter", detail, filtered, rows))
+        rows = filtered
+    if compiled.aggregates:
+        steps.append(Step("aggregate", ", ".join(aggregate.name for aggregate in compiled.aggregates),
+                          1, rows))
+        rows = 1
+    else:
+        rows = optimise_order(compiled, table_stats, rows)
+    if statement.offset or statement.limit is not None:
+        limited = max(0.0, rows - statement.offset)
+        if statement.limit is not None:
+            limited = min(limited, statement.limit)
+        detail = f"offset {statement.offset}" + ("" if statement.limit is None
+                                                  else f", limit {statement.limit}")
+        steps.append(Step("limit", detail, limited, 0))
+    return compiled
+
+
+def optimise_order(compiled: Plan, table_stats: stats.TableStats, rows: float) -> float:
+    """Choose how to sort and de-duplicate, returning the estimated rows produced."""
+    statement = compiled.statement
+    order = ", ".join(statement.order or []) + (" desc" if statement.descending else "")
+    column_idx = [compiled.table.columns.index(column) for column in compiled.columns]
+    distinct = table_stats.distinct(column_idx, rows) if statement.distinct else rows
+    needed = None if statement.limit is None else statement.offset + statement.limit
+    if compiled.order_key and statement.distinct:
+        sort_first = sort_cost(rows) + rows
+        distinct_first = rows + sort_cost(distinct)
+        compiled.distinct_first = distinct_first < sort_first
+        if compiled.distinct_first:
+            compiled.steps.append(Step("hash distinct, then sort", order, distinct, distinct_first))
+        else:
+            compiled.steps.append(Step("sort, then distinct", order, distinct, sort_first))
+        return distinct
+    if compiled.order_key:
+        if needed is not None and HEAP_FACTOR * rows * math.log2(needed + 1) < sort_cost(rows):
+            compiled.top_k = needed
+            compiled.steps.append(Step("top-k sort", f"{order}, k = {needed}", min(rows, needed),
+                                       HEAP_FACTOR * rows * math.log2(needed + 1)))
+            return min(rows, needed)
+        compiled.steps.append(Step("sort", order, rows, sort_cost(rows)))
+    if statement.distinct:
+        compiled.steps.append(Step("hash distinct", ", ".join(compiled.columns), distinct, rows))
+    return distinct
+
+
+def plan(statement: Select, database: Dict[str, Table], optimise_plan: bool = True,
+         budget: Optional[memory.Budget] = None) -> Optional[Plan]:
+    """Resolve a select statement's table and columns, and optionally choose how to run it."""
+    table = database.get(statement.table)
+    if not table:
+        log.error(f"Table `{statement.table}` not found")
+        return None
+    columns = statement.columns if statement.columns != "*" else table.columns
+    log.debug("col %s", columns)
+    aggregate_idx: Optional[List[Optional[int]]] = None
+    if any(isinstance(column, Aggregate) for column in columns):
+        if not all(isinstance(column, Aggregate) for column in columns):
+            log.error("Every column must be an aggregate, as GROUP BY is not supported.")
+            return None
+        named = column_indexes(table, [column.column for column in columns  # type: ignore
+                                       if column.column != "*"])  # type: ignore
+        if named is None:
+            return None
+        named_iter = iter(named)
+        aggregate_idx = [None if column.column == "*" else next(named_iter)  # type: ignore
+                         for column in columns]
+        columns = [column.name for column in columns]  # type: ignore
+        column_idx: Optional[List[int]] = []
+        order_idx: Optional[List[int]] = []
+    else:
+        column_idx = column_indexes(table, columns)  # type: ignore
+        order_idx = column_indexes(table, statement.order or [])
+    if column_idx is None or order_idx is None:
+        return None
+    predicate = None
+    if statement.where:
+        predicate = filters.make_predicate(table.columns, statement.where)
+        if predicate is None:
+            return None
+    compiled = Plan(statement, table, columns, column_idx, order_idx, predicate,  # type: ignore
+                    aggregate_idx, budget)
+    return optimise(compiled) if optimise_plan else compiled
@@ -0,0 +1,117 @@
+"""Open compressed CSV files, decompressing ahead of the reader in a background thread."""
+
+from typing import BinaryIO, Callable, Dict, Optional, Union
+
+import gzip
+import io
+import logging
+import queue
+import threading
+
+log = logging.getLogger(__name__)
+
+BLOCK_SIZE = 256 * 1024
+QUEUE_BLOCKS = 8
+
+
+def open_gzip(path: str) -> BinaryIO:
+    return gzip.open(path, 'rb')  # type: ignore
+
+
+def open_zstd(path: str) -> BinaryIO:
+    try:
+        import zstandard  # type: ignore # pylint: disable=import-outside-toplevel
+    except ImportError as err:
+        raise OSError(f"Reading `{path}` requires the `zstandard` package.") from err
+    return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+
+
+OPENERS: Dict[str, Callable[[str], BinaryIO]] = {
+    ".gz": open_gzip,
+    ".zst": open_zstd,
+}
+
+
+def compression(path: str) -> Optional[str]:
+    """Return the compression suffix of `path`, if it has one we can read."""
+    for suffix in OPENERS:
+        if path.endswith(suffix):
+            return suffix
+    return None
+
+
+class ReadAhead(io.RawIOBase):
+    """A read-only stream whose blocks are read from another stream by a background thread.
+
+    At most `blocks` blocks of `block_size` bytes are buffered, so the producer stays a bounded
+    distance ahead of the consumer. Errors raised by the producer are re-raised on read, as an
+    `OSError` if they are not one already, e.g. `zlib.error` from a corrupt archive.
+    """
+
+    def __init__(self, stream: BinaryIO, block_size: int = BLOCK_SIZE,
+                 blocks: int = QUEUE_BLOCKS) -> None:
+        super().__init__()
+        self._stream = stream
+        self._block_size = block_size
+        self._queue: "queue.Queue[Union[bytes, BaseException, None]]" = queue.Queue(blocks)
+        self._pending = memoryview(b"")
+        self._finished = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def _produce(self) -> None:
+        try:
+            while not self._stop.is_set():
+                block = self._stream.read(self._block_size)
+                if not block:
+                    break
+                self._queue.put(block)
+            self._queue.put(None)
+        except OSError as err:
+            self._queue.put(err)
+        except Exception as err:  # pylint: disable=broad-except
+            error = OSError(f"Unable to decompress: {err}")
+            error.__cause__ = err
+            self._queue.put(error)
+        except BaseException as err:  # pylint: disable=broad-except
+            self._queue.put(err)
+        finally:
+            self._stream.close()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Union[bytearray, memoryview]) -> int:  # type: ignore
+        if not self._pending:
+            if self._finished:
+                return 0
+            item = self._queue.get()
+            if item is None or isinstance(item, BaseException):
+                self._finished = True
+                if item is None:
+                    return 0
+                raise item
+            self._pending = memoryview(item)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self) -> None:
+        if not self.closed:
+            self._stop.set()
+            while self._thread.is_alive():
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    self._thread.join(0.01)
+        super().close()
+
+
+def open_compressed(path: str) -> BinaryIO:
+    """Open a compressed file for buffered reading, decompressing in a background thread."""
+    suffix = compression(path)
+    if not suffix:
+        raise ValueError(f"`{path}` is not a supported compressed file.")
+    return io.BufferedReader(ReadAhead(OPENERS[suffix](path)), BLOCK_SIZE)  # type: ignore
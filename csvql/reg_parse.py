@@ -1,169 +1,470 @@
-"""Parse SQL using regex-like expressions."""
+"""Parse SQL using regex-like expressions over token classes.
+
+Each pattern in `PATTERNS` is matched against the labels of the tokens by a packrat parser: every
+`{rule}` is matched at most once at each token offset and its result memoised, so a script is
+parsed in time linear in its number of tokens. Alternatives are ordered and repetition is greedy,
+as in a parsing expression grammar, so `{condition}` is tried before the patterns it overlaps.
+"""
 
 import re
+import functools
 from dataclasses import dataclass
-from typing import List, Match, Dict, Any, Optional, Callable
+from typing import List, Dict, Any, Callable, Optional, Set, Tuple
 
 import logging
 
 from . import tokenise
+from .grammer import Keyword
+from .parse import Clause, Call, get_form
+from .tokenise import Token
 
 logger = logging.getLogger(__name__)
 
 TEST_QUERY = "from table select * id, name cross join table2; from table2 select count(distinct id foo );"
 
-TOKEN_LIST = [
-    ("w", "Word"),
-    ("f", "Aggregate"),
-    ("c", "Clause"),
-    ("b", "Prefix"),
-    ("a", "Postfix"),
-    (",", "Comma"),
-    (";", "Semicolon"),
-    ("(", "Left"),
-    (")", "Right"),
-    ("*", "Asterisk")
-]
-
-DISCARDABLE_TOKENS = ["Left", "Right", "Comma", "Semicolon"]
-
-TOKEN_MAP = {
-    **{key: value for (key, value) in TOKEN_LIST},
-    **{key: value for (value, key) in TOKEN_LIST}
-}
-
-TEST_TOKENS = tokenise.tokenise(TEST_QUERY)
-
-TEST_STR = "".join([TOKEN_MAP[token.label.capitalize()] for token in TEST_TOKENS])
+DISCARDABLE_TOKENS = ["left", "right", "comma", "semicolon"]
 
 PATTERNS = {
     "ast" : "{statement}*",
-    "statement" : "{clause}+ Semicolon",
-    "clause" : "Prefix* Clause ({column_list}|{list}|{expression}) Postfix*",
+    "statement" : "{clause}+ Semicolon?",
+    "clause" : "Prefix* Clause ({condition}|{column_list}|{list}|{expression})? Postfix*",
+    "condition" : "{comparison} (Word {comparison})*",
+    "comparison" : "{operand} Operator {operand}",
+    "operand" : "Word | Number",
     "column_list" : "Prefix? ({aggregate}|{column}) (Comma ({aggregate}|{column}))*",
-    "aggregate" : "Aggregate Left Prefix? {column} Right",
+    "aggregate" : "Aggregate Left Prefix? {column} (Comma Number)? Right",
     "column" : "Word | Asterisk",
     "list" : "Word (Comma Word)*",
-    "expression" : "Word"
+    "expression" : "Word | Number"
 }
 
-COMPILED_PATTERNS: Dict[str, str] = {}
+# A compiled pattern is a tree of `("term", label)`, `("rule", name)`, `("seq", items)`,
+# `("alt", options)` and `("repeat", minimum, maximum, item)` tuples.
+Pattern = Tuple[Any, ...]
+
+PATTERN_TOKEN = re.compile(r"\s*(?:(?P<rule>{\w+})|(?P<term>[A-Z][a-z]+)|(?P<op>[()|*+?]))")
+
+# A pattern compiles to a matcher, which matches at a token offset, appends the rules it matched
+# to a list, and returns the offset after the match or -1 if it failed.
+Matcher = Callable[["Packrat", int, List["Node"]], int]
 
 @dataclass
 class Expr():
     name: str
     pattern: str
-    children: List[str]
-
-def get_children(query: str) -> List[str]:
-    return list(dict.fromkeys([match[0][1:-1] for match in re.finditer("{.*?}", query)]))
-
-def match_token(match: Match[str]) -> str:
-    return re.escape(TOKEN_MAP[match[0]])
-
-def match_pattern(match: Match[str]) -> str:
-    name = match[0][1:-1]
-    if name in COMPILED_PATTERNS:
-        return "(" + COMPILED_PATTERNS[name] +")"
-    return "(" + compile_pattern(name, PATTERNS[name]) + ")"
-
-def compile_pattern(name: str, query: str) -> str:
-    query = query.replace(" ", "")
-    query = re.sub("[A-Z][a-z]+", match_token, query)
-    query = re.sub("{.*?}", match_pattern, query)
-    COMPILED_PATTERNS[name] = query
-    return query
-
-def make_expr(name: str, pattern: str) -> Expr:
-    return Expr(name, compile_pattern(name, pattern), get_children(pattern))
-
-EXPRS = {key: make_expr(key, value) for (key, value) in PATTERNS.items()}
-
-def ref(expr: Expr) -> str:
-    return f"(?P<{expr.name}>{expr.pattern})"
-
-ENDC = '\033[0m'
-GREEN = '\033[92m\033[4m'
-RED = '\033[91m'
-
-def str_zip(compare: Callable[[str, str], str], left: str, right: str) -> str:
-    assert len(left) == len(right)
-    return "".join([compare(left[i], right[i]) for (i, _) in enumerate(left)])
-
-def clear(string: str, x: int, y: int) -> str:
-    return string[:x] + (y-x) * '_' + string[y:]
-
-def clear_complement(string: str, x: int, y: int) -> str:
-    return x * '_' + string[x:y] + (len(string)-y) * '_'
-
-def union(left: str, right: str) -> str:
-    return "_" if left == "_" or right == "_" else left
-
-def mask(candidate: str, matched: str) -> str:
-    return "_" if matched != "_" else candidate
+    tree: Pattern
+    matcher: Matcher
+
+def lex_pattern(query: str) -> List[Tuple[str, str]]:
+    """Split a pattern into rule references, token labels and operators."""
+    parts = []
+    pos = 0
+    query = query.rstrip()
+    while pos < len(query):
+        match = PATTERN_TOKEN.match(query, pos)
+        if not match:
+            raise ValueError(f"Cannot compile pattern `{query}` at `{query[pos:]}`.")
+        kind = match.lastgroup or ""
+        value = match[kind]
+        parts.append((kind, value[1:-1] if kind == "rule" else value))
+        pos = match.end()
+    return parts
+
+def compile_pattern(query: str) -> Pattern:
+    """Compile a pattern, by recursive descent over `alternative := sequence ('|' sequence)*`."""
+    parts = lex_pattern(query)
+    pos = 0
+
+    def peek() -> Optional[str]:
+        return parts[pos][1] if pos < len(parts) and parts[pos][0] == "op" else None
+
+    def alternative() -> Pattern:
+        nonlocal pos
+        options = [sequence()]
+        while peek() == "|":
+            pos += 1
+            options.append(sequence())
+        return options[0] if len(options) == 1 else ("alt", options)
+
+    def sequence() -> Pattern:
+        items = []
+        while pos < len(parts) and peek() not in ("|", ")"):
+            items.append(item())
+        return items[0] if len(items) == 1 else ("seq", items)
+
+    def item() -> Pattern:
+        nonlocal pos
+        kind, value = parts[pos]
+        pos += 1
+        if kind == "rule":
+            atom: Pattern = ("rule", value)
+        elif kind == "term":
+            atom = ("term", value.lower())
+        elif value == "(":
+            atom = alternative()
+            if peek() != ")":
+                raise ValueError(f"Unbalanced brackets in pattern `{query}`.")
+            pos += 1
+        else:
+            raise ValueError(f"Unexpected `{value}` in pattern `{query}`.")
+        repeat = {"*": (0, None), "+": (1, None), "?": (0, 1)}.get(peek() or "")
+        if repeat:
+            pos += 1
+            atom = ("repeat", *repeat, atom)
+        return atom
+
+    tree = alternative()
+    if pos != len(parts):
+        raise ValueError(f"Unexpected `{parts[pos][1]}` in pattern `{query}`.")
+    return tree
+
+def first_labels(tree: Pattern, trees: Dict[str, Pattern]) -> Tuple[Set[str], bool]:
+    """Return the token labels a pattern can start with, and whether it can match nothing."""
+    kind = tree[0]
+    if kind == "term":
+        return {tree[1]}, False
+    if kind == "rule":
+        return first_labels(trees[tree[1]], trees)
+    if kind == "repeat":
+        labels, nullable = first_labels(tree[3], trees)
+        return labels, nullable or tree[1] == 0
+    labels = set()
+    if kind == "alt":
+        nullable = False
+        for option in tree[1]:
+            option_labels, option_nullable = first_labels(option, trees)
+            labels |= option_labels
+            nullable = nullable or option_nullable
+        return labels, nullable
+    for item in tree[1]:
+        item_labels, item_nullable = first_labels(item, trees)
+        labels |= item_labels
+        if not item_nullable:
+            return labels, False
+    return labels, True
+
+def make_matcher(tree: Pattern, trees: Dict[str, Pattern]) -> Matcher:  # pylint: disable=too-many-return-statements
+    """Build a matcher for a compiled pattern, from closures rather than by walking the tree.
+
+    Rules and alternatives which cannot start with the next token's label fail without being tried,
+    so only rules which might match are memoised.
+    """
+    kind = tree[0]
+    if kind == "term":
+        label = tree[1]
+        def term(parser: "Packrat", pos: int, children: List["Node"]) -> int:
+            if pos < len(parser.labels) and parser.labels[pos] == label:
+                return pos + 1
+            if pos > parser.furthest:
+                parser.furthest = pos
+            return -1
+        return term
+    if kind == "rule":
+        name = tree[1]
+        starts, nullable = first_labels(tree, trees)
+        def rule(parser: "Packrat", pos: int, children: List["Node"]) -> int:
+            if not nullable and parser.label(pos) not in starts:
+                if pos > parser.furthest:
+                    parser.furthest = pos
+                return -1
+            node = parser.rule(name, pos)
+            if node is None:
+                return -1
+            children.append(node)
+            return node.end
+        return rule
+    if kind == "alt":
+        options = []
+        for option in tree[1]:
+            labels, nullable = first_labels(option, trees)
+            options.append((None if nullable else labels, make_matcher(option, trees)))
+        def alt(parser: "Packrat", pos: int, children: List["Node"]) -> int:
+            label = parser.label(pos)
+            for labels, option in options:
+                if labels is not None and label not in labels:
+                    continue
+                end = option(parser, pos, children)
+                if end >= 0:
+                    return end
+            if pos > parser.furthest:
+                parser.furthest = pos
+            return -1
+        return alt
+    if kind == "seq":
+        items = [make_matcher(item, trees) for item in tree[1]]
+        def seq(parser: "Packrat", pos: int, children: List["Node"]) -> int:
+            mark = len(children)
+            for item in items:
+                pos = item(parser, pos, children)
+                if pos < 0:
+                    del children[mark:]
+                    return -1
+            return pos
+        return seq
+    _, minimum, maximum, item = tree
+    sub = make_matcher(item, trees)
+    def repeat(parser: "Packrat", pos: int, children: List["Node"]) -> int:
+        start = len(children)
+        count = 0
+        while maximum is None or count < maximum:
+            mark = len(children)
+            end = sub(parser, pos, children)
+            if end < 0:
+                break
+            if end == pos:
+                del children[mark:]
+                break
+            pos = end
+            count += 1
+        if count < minimum:
+            del children[start:]
+            return -1
+        return pos
+    return repeat
+
+@functools.lru_cache(maxsize=None)
+def get_exprs() -> Dict[str, Expr]:
+    """Compile `PATTERNS` on first use."""
+    trees = {key: compile_pattern(value) for (key, value) in PATTERNS.items()}
+    return {key: Expr(key, PATTERNS[key], tree, make_matcher(tree, trees))
+            for (key, tree) in trees.items()}
 
 @dataclass
 class Node:
+    """A rule matched over the tokens `start` to `end`."""
     name: str
-    match: str
-    exclusion: str
+    start: int
+    end: int
     children: List['Node']
 
-def rere(expr: Expr, query: str, depth: int = 0, start: int = 0, end: int = -1) -> List[Node]:
-    if end == -1:
-        end = len(query)
-    try:
-        results = re.finditer(expr.pattern, query[slice(start, end)])
-    except re.error as exception:
-        print(exception.__dict__)
-        print(exception.pattern[exception.pos:]) # type: ignore
-        raise exception
-    big_ls: List[Node] = []
-    global_matched = query
-    for match in results:
-        if not match[0]:
+class Packrat:
+    """Match rules against a list of tokens, memoising each rule's result at each offset."""
+
+    def __init__(self, tokens: List[Token]) -> None:
+        self.tokens = tokens
+        self.labels = [token.label for token in tokens]
+        self.exprs = get_exprs()
+        self.memo: Dict[Tuple[str, int], Optional[Node]] = {}
+        # The furthest offset at which a token failed to match, for error messages.
+        self.furthest = 0
+
+    def rule(self, name: str, pos: int) -> Optional[Node]:
+        key = (name, pos)
+        if key not in self.memo:
+            children: List[Node] = []
+            end = self.exprs[name].matcher(self, pos, children)
+            self.memo[key] = Node(name, pos, end, children) if end >= 0 else None
+        return self.memo[key]
+
+    def label(self, pos: int) -> Optional[str]:
+        return self.labels[pos] if pos < len(self.labels) else None
+
+    def text(self, start: int, end: int) -> str:
+        return " ".join(token.value for token in self.tokens[start:end])
+
+def next_semicolon(tokens: List[Token], pos: int) -> int:
+    while pos < len(tokens) and tokens[pos].label != "semicolon":
+        pos += 1
+    return pos
+
+def parse_tree(tokens: List[Token]) -> List[Optional[Node]]:
+    """Match each statement in a script, logging and skipping those which do not parse."""
+    parser = Packrat(tokens)
+    statements: List[Optional[Node]] = []
+    pos = 0
+    while pos < len(tokens):
+        if tokens[pos].label == "semicolon":
+            pos += 1
+            continue
+        parser.furthest = pos
+        node = parser.rule("statement", pos)
+        # No rule matches across a semicolon, so results for earlier statements are never reused.
+        parser.memo.clear()
+        if node and (node.end == len(tokens) or tokens[node.end - 1].label == "semicolon"):
+            statements.append(node)
+            pos = node.end
             continue
+        end = next_semicolon(tokens, pos)
+        failed = min(max(parser.furthest, node.end if node else pos), end)
+        logger.error("Could not parse '%s'." % parser.text(failed, end))
+        statements.append(None)
+        pos = end + 1
+    return statements
+
+def owned(node: Node) -> List[int]:
+    """List the offsets of the tokens in `node` which are not in any of its children."""
+    inner = {pos for child in node.children for pos in range(child.start, child.end)}
+    return [pos for pos in range(node.start, node.end) if pos not in inner]
+
+def make_call(node: Node, tokens: List[Token]) -> Call:
+    span = tokens[node.start:node.end]
+    flags: Set[Keyword] = {token.value for token in span if token.label == "prefix"}  # type: ignore
+    arguments = [token.value for token in span[1:] if token.label in ("word", "asterisk", "number")]
+    return Call(span[0].value, flags, arguments)  # type: ignore
+
+def make_expression(clause: Clause, node: Optional[Node], tokens: List[Token]) -> Any:
+    """Convert a clause's argument into the expression `parse.parse_query` would produce."""
+    form = clause.form
+    name = form.name
+    if form.expression in ("none", "statement"):
+        if node:
+            logger.error(f"Unexpected `{tokens[node.start].value}` after `{name}`.")
+            return False
+        return None
+    if not node:
+        logger.error(f"Expected {form.expression} after `{name}`.")
+        return False
+    if form.expression in ("table-name", "number"):
+        if node.end - node.start != 1 or tokens[node.start].label not in ("word", "number"):
+            logger.error(f"Expected {form.expression} after `{name}`.")
+            return False
+        return tokens[node.start].value
+    if form.expression == "condition":
+        if node.name != "condition":
+            logger.error("Expected `column operator value`, but got "
+                         f"`{' '.join(token.value for token in tokens[node.start:node.end])}`.")
+            return False
+        for pos in owned(node):
+            if tokens[pos].value.lower() != "and":
+                logger.error(f"Expected `and` between conditions, but got `{tokens[pos].value}`.")
+                return False
+        comparisons = []
+        for child in node.children:
+            comparison = [token.value for token in tokens[child.start:child.end]]
+            if tokens[child.start].label != "word":
+                logger.error(f"Expected `column operator value`, but got `{' '.join(comparison)}`.")
+                return False
+            comparisons.append(comparison)
+        return comparisons
+    # A column list.
+    first = tokens[node.start]
+    if first.label == "prefix":
+        if first.value not in form.infix_flags:
+            logger.error(f"Keyword `{first.value}` is not a valid flag for `{name}`.")
+            return False
+        clause.flags.add(first.value)  # type: ignore
+    if node.name == "condition":
+        logger.error(f"Expected column list after `{name}`.")
+        return False
+    if node.children and node.children[0].name == "column" and tokens[node.children[0].start].value == "*":
+        return "*"
+    if node.name in ("list", "expression"):
+        return [tokens[pos].value for pos in range(node.start, node.end)
+                if tokens[pos].label in ("word", "number")]
+    return [make_call(child, tokens) if child.name == "aggregate" else tokens[child.start].value
+            for child in node.children]
+
+def make_clause(node: Node, tokens: List[Token]) -> Optional[Clause]:
+    """Convert a matched clause, without its child clauses."""
+    argument = node.children[0] if node.children else None
+    pos = node.start
+    prefixes = []
+    while tokens[pos].label == "prefix":
+        prefixes.append(tokens[pos].value)
+        pos += 1
+    form = get_form(tokens[pos].value)
+    if form is None:
+        logger.error(f"Keyword `{tokens[pos].value}` is not a valid clause name.")
+        return None
+    for prefix in prefixes:
+        if prefix not in form.prefix_flags:
+            logger.error(f"Keyword `{prefix}` is not a valid prefix for `{form.name}`.")
+            return None
+    clause = Clause(form, set(prefixes), None, {})  # type: ignore
+    expression = make_expression(clause, argument, tokens)
+    if expression is False:
+        return None
+    clause.expression = expression
+    for pos in range(argument.end if argument else pos + 1, node.end):
+        if tokens[pos].value not in form.postfix_flags:
+            logger.error(f"Keyword `{tokens[pos].value}` is not a valid flag for `{form.name}`.")
+            return None
+        clause.flags.add(tokens[pos].value)  # type: ignore
+    return clause
+
+def accepts(parent: Clause, child: Clause) -> bool:
+    """Whether `child` may follow the clauses already nested in `parent`."""
+    form = parent.form
+    if form.expression == "statement" and parent.expression is None:
+        return True
+    order: List[str] = [*form.required_clauses, *form.optional_clauses]
+    if child.form.name not in order:
+        return False
+    return all(order.index(name) < order.index(child.form.name) for name in parent.children)
+
+def complete(clause: Clause) -> bool:
+    """Check that `clause` and the clauses nested in it have the clauses they require."""
+    if clause.form.expression == "statement" and clause.expression is None:
+        logger.error(f"Expected a statement after `{clause.form.name}`.")
+        return False
+    for name in clause.form.required_clauses:
+        if name not in clause.children:
+            logger.error(f"`{name}` clause required.")
+            return False
+    nested = list(clause.children.values())
+    if isinstance(clause.expression, Clause):
+        nested.append(clause.expression)
+    return all(complete(child) for child in nested)
+
+def make_statement(node: Node, tokens: List[Token]) -> Optional[Clause]:
+    """Nest a statement's clauses as `parse.parse` does."""
+    clauses = []
+    for child in node.children:
+        clause = make_clause(child, tokens)
+        if clause is None:
+            return None
+        clauses.append(clause)
+    root = clauses[0]
+    if not root.form.primary:
+        logger.error(f"Error: Clause `{root.form.name}` is not primary.")
+        return None
+    stack = [root]
+    for clause in clauses[1:]:
+        while stack and not accepts(stack[-1], clause):
+            stack.pop()
+        if not stack:
+            logger.error(f"Error: Unexpected clause `{clause.form.name}`.")
+            return None
+        parent = stack[-1]
+        if parent.form.expression == "statement" and parent.expression is None:
+            if not clause.form.primary:
+                logger.error(f"Expected a statement after `{parent.form.name}`, but got "
+                             f"`{clause.form.name}`.")
+                return None
+            parent.expression = clause
+        else:
+            parent.children[clause.form.name] = clause
+        stack.append(clause)
+    return root if complete(root) else None
+
+def parse_script(tokens: List[Token]) -> List[Optional[Clause]]:
+    """Parse every statement in a script, as `parse.parse` would parse each one separately."""
+    return [make_statement(node, tokens) if node else None for node in parse_tree(tokens)]
+
+ENDC = '\033[0m'
+RED = '\033[91m'
 
-        sub_start = start + match.start(0)
-        sub_end = start + match.end(0)
-
-        matched = clear_complement(query, sub_start, sub_end)
-        # print(global_matched, 1, expr.name)
-        global_matched = str_zip(mask, global_matched, matched)
-        # print(global_matched, 2, expr.name)
-        candidates = matched
-
-        if not expr.children:
-            big_ls.append(Node(expr.name, candidates, candidates, []))
-        little_ls: List[Node] = []
-        exclude: str = matched
-        for child_expr in expr.children:
-            new = rere(EXPRS[child_expr], candidates, depth+1, sub_start, sub_end)
-            for tree in new:
-                candidates = str_zip(mask, candidates, tree.match)
-                exclude = str_zip(mask, exclude, tree.match)
-            little_ls += new
-        if little_ls:
-            big_ls.append(Node(expr.name, matched, str_zip(union, matched, exclude), little_ls))
-    if depth == 0 and global_matched.replace("", "_"):
-        for match in re.finditer("[^_]+", global_matched):
-            logger.error("Could not parse '%s'." % 
-                " ".join([TEST_TOKENS[pos].value for pos in range(match.start(), match.end())])
-            )
-    return big_ls
-
-result = rere(EXPRS['ast'], TEST_STR)
-
-def color(match: str, exclusion: str) -> str:
-    if exclusion != '_':
-        return RED + exclusion + ENDC
-    if match != '_':
-        return match
-    return '_'
-
-def print_tree(tree_list: List[Node], depth: int = 0) -> str:
-    return (
-        "".join([f"{str_zip(color, tree.match, tree.exclusion)} | {depth * '. ' + tree.name:<20} | {[(pos, TOKEN_MAP[key], TEST_TOKENS[pos].value) for (pos, key) in enumerate(tree.exclusion) if key != '_' and TOKEN_MAP[key] not in DISCARDABLE_TOKENS]}\n" + print_tree(tree.children, depth+1) for tree in tree_list])
-    )
-
-print(print_tree(result))
+def print_tree(tree_list: List[Node], tokens: List[Token], depth: int = 0) -> str:
+    """Draw each node over the token classes, highlighting the tokens it matched itself."""
+    lines = ""
+    for tree in tree_list:
+        own = owned(tree)
+        marks = "".join(
+            RED + tokens[pos].label[0] + ENDC if pos in own else
+            tokens[pos].label[0] if tree.start <= pos < tree.end else "_"
+            for pos in range(len(tokens))
+        )
+        values = [(pos, tokens[pos].label, tokens[pos].value) for pos in own
+                  if tokens[pos].label not in DISCARDABLE_TOKENS]
+        lines += f"{marks} | {depth * '. ' + tree.name:<20} | {values}\n"
+        lines += print_tree(tree.children, tokens, depth + 1)
+    return lines
+
+def main(query: str = TEST_QUERY) -> None:
+    """Parse `query` and print the resulting tree."""
+    tokens = tokenise.tokenise(query)
+    result = [node for node in parse_tree(tokens) if node]
+    print(print_tree(result, tokens))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Fixed-size sketches for approximate aggregates."""
+
+from typing import Any, Callable, List, Optional
+
+import hashlib
+import math
+import random
+
+HASH_BITS = 64
+
+
+class HyperLogLog:
+    """Estimate the number of distinct values added, using `2 ** precision` one byte registers.
+
+    The relative standard error of the estimate is `1.04 / sqrt(2 ** precision)`, about 1.6% for
+    the default precision.
+    """
+
+    def __init__(self, precision: int = 12) -> None:
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+
+    def add(self, value: str) -> None:
+        # Python's own string hash is randomised per process, so estimates would vary between runs.
+        hashed = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+        index = hashed >> (HASH_BITS - self.precision)
+        rest = hashed & ((1 << (HASH_BITS - self.precision)) - 1)
+        rank = HASH_BITS - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self) -> float:
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        raw = alpha * self.size ** 2 / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * self.size and zeros:
+            return self.size * math.log(self.size / zeros)
+        return raw
+
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.size)
+
+
+class QuantileSketch:
+    """Estimate quantiles from a uniform sample of at most `size` values, by reservoir sampling.
+
+    With `n` values sampled, a quantile's rank is within `sqrt(ln(2 / delta) / (2 n))` of the
+    requested rank with probability `1 - delta` (the Dvoretzky-Kiefer-Wolfowitz inequality).
+    """
+
+    def __init__(self, size: int = 4096, rand: Optional[random.Random] = None) -> None:
+        self.size = size
+        self.sample: List[Any] = []
+        self.count = 0
+        self.random = rand or random.Random()
+
+    def add(self, value: Any) -> None:
+        self.count += 1
+        if len(self.sample) < self.size:
+            self.sample.append(value)
+            return
+        index = self.random.randrange(self.count)
+        if index < self.size:
+            self.sample[index] = value
+
+    def quantile(self, fraction: float, key: Optional[Callable[[Any], Any]] = None) -> Any:
+        """Return the value at `fraction` (0 to 1) of the way through the sorted values."""
+        if not self.sample:
+            return None
+        ordered = sorted(self.sample, key=key)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def rank_error(self, delta: float = 0.05, sampled: bool = False) -> float:
+        """Bound the error in the rank of a quantile, as a fraction of the values added.
+
+        If the values added were themselves `sampled` from a larger population, the bound is for
+        the rank within that population.
+        """
+        if not self.sample or (self.count <= self.size and not sampled):
+            return 0.0
+        return math.sqrt(math.log(2 / delta) / (2 * len(self.sample)))
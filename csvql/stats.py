@@ -0,0 +1,159 @@
+"""Table statistics for the planner: row counts, distinct estimates and value histograms.
+
+Statistics are gathered per column the first time the planner asks for them, and caught up with
+rows appended since, so each row is read once per column. A full reload of a table discards them,
+and only the statistics of the `MAX_TABLES` tables planned most recently are kept. Each column's
+statistics are sketches of a fixed size.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import bisect
+import collections
+import itertools
+import logging
+import threading
+
+from . import database
+from .database import Table, Row
+from .filters import number
+from .sketches import HyperLogLog, QuantileSketch
+from .transactions import Condition
+
+log = logging.getLogger(__name__)
+
+MAX_TABLES = 64
+HISTOGRAM_BUCKETS = 16
+# Selectivity of a range comparison that the histogram cannot estimate.
+DEFAULT_RANGE_SELECTIVITY = 1 / 3
+
+
+class ColumnStats:
+    """Sketches of the values in one column."""
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.numbers = 0
+        self.distinct_sketch = HyperLogLog()
+        self.sample = QuantileSketch()
+        self._histogram: Optional[List[Any]] = None
+
+    def add(self, value: str) -> None:
+        self.rows += 1
+        if number(value) is not None:
+            self.numbers += 1
+        self.distinct_sketch.add(value)
+        self.sample.add(value)
+        self._histogram = None
+
+    @property
+    def numeric(self) -> bool:
+        return self.rows > 0 and self.numbers == self.rows
+
+    def distinct(self) -> float:
+        """Estimate the number of distinct values, which is at least one and at most the rows."""
+        return min(float(self.rows), max(1.0, self.distinct_sketch.estimate()))
+
+    def histogram(self) -> List[Any]:
+        """Return `HISTOGRAM_BUCKETS + 1` bounds of equi-depth buckets, from a sample of values."""
+        if self._histogram is None:
+            key = float if self.numeric else None
+            ordered = sorted(self.sample.sample, key=key)  # type: ignore
+            if self.numeric:
+                ordered = [float(value) for value in ordered]
+            self._histogram = [
+                ordered[(len(ordered) - 1) * bucket // HISTOGRAM_BUCKETS]
+                for bucket in range(HISTOGRAM_BUCKETS + 1)
+            ] if ordered else []
+        return self._histogram
+
+    def below(self, value: str) -> Optional[float]:
+        """Estimate the fraction of values below `value`, comparing as the filters do."""
+        bounds = self.histogram()
+        value_number = number(value)
+        if not bounds or (self.numbers and not self.numeric):
+            return None
+        if self.numeric and value_number is None:
+            return None
+        key: Any = value_number if self.numeric else value
+        bucket = bisect.bisect_right(bounds, key)
+        if bucket == 0:
+            return 0.0
+        if bucket > HISTOGRAM_BUCKETS:
+            return 1.0
+        low, high = bounds[bucket - 1], bounds[bucket]
+        within = (key - low) / (high - low) if self.numeric and high > low else 0.5
+        return (bucket - 1 + within) / HISTOGRAM_BUCKETS
+
+    def selectivity(self, condition: Condition) -> float:
+        """Estimate the fraction of rows for which `condition` holds."""
+        if condition.operator == "=":
+            return 1 / self.distinct()
+        if condition.operator in ("!=", "<>"):
+            return 1 - 1 / self.distinct()
+        below = self.below(condition.value)
+        if below is None:
+            return DEFAULT_RANGE_SELECTIVITY
+        return below if condition.operator in ("<", "<=") else 1 - below
+
+
+class TableStats:
+    """Statistics for the columns of one table, gathered as they are needed."""
+
+    def __init__(self, table: Table) -> None:
+        self.table = table
+        self.columns: Dict[int, ColumnStats] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def rows(self) -> int:
+        return len(self.table.rows)
+
+    def column(self, idx: int) -> ColumnStats:
+        with self._lock:
+            stats = self.columns.setdefault(idx, ColumnStats())
+            if stats.rows < self.rows:
+                for row in itertools.islice(self.table.rows, stats.rows, self.rows):
+                    stats.add(row[idx])
+                log.debug(f"Gathered statistics for column {idx} over {stats.rows} rows.")
+        return stats
+
+    def selectivity(self, conditions: List[Condition]) -> float:
+        """Estimate the fraction of rows meeting all of `conditions`, assuming independence."""
+        fraction = 1.0
+        for condition in conditions:
+            fraction *= self.column(self.table.columns.index(condition.column)).selectivity(condition)
+        return fraction
+
+    def distinct(self, column_idx: List[int], rows: float) -> float:
+        """Estimate the number of distinct combinations of some columns among `rows` rows."""
+        combinations = 1.0
+        for idx in column_idx:
+            combinations *= self.column(idx).distinct()
+        return max(1.0, min(rows, combinations))
+
+
+# Keyed by table id, in order of use. The tables are held by their statistics, so their ids are
+# not reused while they have an entry.
+STATS: "collections.OrderedDict[int, TableStats]" = collections.OrderedDict()
+STATS_LOCK = threading.Lock()
+
+
+def table_stats(table: Table) -> TableStats:
+    with STATS_LOCK:
+        stats = STATS.get(id(table))
+        if stats is None:
+            stats = STATS[id(table)] = TableStats(table)
+        STATS.move_to_end(id(table))
+        while len(STATS) > MAX_TABLES:
+            STATS.popitem(last=False)
+    return stats
+
+
+def discard(table: Table, appended: Optional[List[Row]]) -> None:
+    """Drop the statistics of a reloaded table; appended rows are caught up with lazily."""
+    if appended is None:
+        with STATS_LOCK:
+            STATS.pop(id(table), None)
+
+database.REFRESH_HOOKS.append(discard)
@@ -34,6 +34,10 @@ def group_regexes(regexes: List[Tuple[RegexLabel, str]]) -> str:
     """Generate a regex expression, from a list of labelled sub-expressions."""
     return or_regexes([f"(?P<{label}>{pattern})" for label, pattern in regexes])
 
+def keyword_regex(keywords: List[str]) -> str:
+    """Match any of `keywords` as whole words, case insensitively and allowing any spacing."""
+    return "(?i:(?:" + or_regexes([r"\s+".join(keyword.split()) for keyword in keywords]) + r")\b)"
+
 reg_list: List[Tuple[RegexLabel, str]] = [
     ("dquote", '(")(""|[^"])*(")'),
     ("squote", "(')(''|[^'])*(')"),
@@ -42,10 +46,10 @@ reg_list: List[Tuple[RegexLabel, str]] = [
     ("comma", re.escape(",")),
     ("semicolon", re.escape(";")),
     ("asterisk", re.escape("*")),
-    ("prefix", "(?i:" + or_regexes(grammer.PREFIX) + ")"),
-    ("postfix", "(?i:" + or_regexes(grammer.POSTFIX) + ")"),
-    ("clause", "(?i:" + or_regexes(grammer.CLAUSE) + ")"),
-    ("aggregate", "(?i:" + or_regexes(grammer.AGGREGATE) + ")"),
+    ("prefix", keyword_regex(grammer.PREFIX)),
+    ("postfix", keyword_regex(grammer.POSTFIX)),
+    ("clause", keyword_regex(grammer.CLAUSE)),
+    ("aggregate", keyword_regex(grammer.AGGREGATE)),
     ("operator", or_regexes([re.escape(x) for x in grammer.OPERATORS])),
     ("number", r"\d+"),
     ("word", r"\w+|\*"),
@@ -55,6 +59,8 @@ reg_list: List[Tuple[RegexLabel, str]] = [
 # Then we extract our tokens from the regex matches, and do some post-processing (such as lower
 # casing keywords and removing extra quotation marks).
 
+KEYWORD_LABELS = ["clause", "prefix", "postfix", "aggregate"]
+
 def extract_token(match: Match[str]) -> Token:
     """Provided with a match, extract a token."""
     for key, value in match.groupdict().items():
@@ -68,8 +74,8 @@ def extract_token(match: Match[str]) -> Token:
                 if value[0] == "\"" and value[-1] == "\"":
                     value = value[1:-1]
                 return Token("word", value.replace("\"\"", "\""))
-            if key == "keyword":
-                return Token("keyword", value.lower())
+            if key in KEYWORD_LABELS:
+                return Token(key, " ".join(value.lower().split()))  # type: ignore
             return Token(key, value)  # type: ignore
     raise ValueError
 
@@ -79,5 +85,12 @@ def extract_token(match: Match[str]) -> Token:
 def tokenise(query: str) -> List[Token]:
     """Generate tokens for a given SQL query."""
     log.debug("Debug - Regex: %s", group_regexes(reg_list))
-    matches = re.finditer(group_regexes(reg_list), query)
-    return [extract_token(token) for token in matches]
+    tokens: List[Token] = []
+    for match in re.finditer(group_regexes(reg_list), query):
+        token = extract_token(match)
+        if (token.label == "postfix" and token.value in grammer.NUMBER_POSTFIX
+                and not (tokens and tokens[-1].label == "number")):
+            tokens.extend(Token("word", word) for word in match.group().split())
+        else:
+            tokens.append(token)
+    return tokens
@@ -42,6 +42,10 @@ class Smariter(collections.abc.Iterator, Generic[T]):  # type: ignore
         """Retrieve the current buffered value (i.e. the last returned by `next`)."""
         return self._list[self._i] if self._i < len(self._list) else None
 
+    def remaining(self) -> List[T]:
+        """Retrieve the current buffered value and every value after it."""
+        return self._list[max(self._i, 0):]
+
     def look_ahead(self, offset: int) -> Optional[T]:
         """Look ahead to some offset."""
         return self._list[self._i + offset] if self._i + offset < len(self._list) else None
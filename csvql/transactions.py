@@ -1,15 +1,57 @@
 """Defines database commands."""
 
-from typing import Union, List, Optional
-from dataclasses import dataclass
+from typing import NamedTuple, Union, List, Optional
+from dataclasses import dataclass, field
 
 from typing_extensions import Literal
 
+class Condition(NamedTuple):
+    """A comparison between a column and a value."""
+    column: str
+    operator: str
+    value: str
+
+
+class Aggregate(NamedTuple):
+    """An aggregate function applied to a column."""
+    function: str
+    column: str
+    distinct: bool = False
+    argument: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        """Name the result column after the call, e.g. `count(distinct id)`."""
+        distinct = "distinct " if self.distinct else ""
+        argument = f", {self.argument}" if self.argument is not None else ""
+        return f"{self.function}({distinct}{self.column}{argument})"
+
+
 @dataclass
 class Select:
     """A SELECT statement."""
     distinct: bool
-    columns: Union[List[str], Literal["*"]]
-    order: List[str]
+    columns: Union[List[Union[str, Aggregate]], Literal["*"]]
+    order: Optional[List[str]]
     table: str
     limit: Optional[int]
+    descending: bool = False
+    offset: int = 0
+    where: List[Condition] = field(default_factory=list)
+    sample: Optional[float] = None
+
+
+@dataclass
+class CreateView:
+    """A CREATE MATERIALIZED VIEW statement."""
+    name: str
+    select: Select
+
+
+@dataclass
+class Explain:
+    """An EXPLAIN statement, describing how a select would be run."""
+    select: Select
+
+
+Statement = Union[Select, CreateView, Explain]
@@ -0,0 +1,169 @@
+"""Materialized views, maintained incrementally as their source tables are appended to."""
+
+from typing import Any, Dict, List, Optional, Set
+from dataclasses import dataclass, field
+
+import heapq
+import logging
+import operator
+
+from . import database, plans
+from .aggregates import Accumulator
+from .database import Table, Row
+from .transactions import Select, CreateView
+
+log = logging.getLogger(__name__)
+
+@dataclass
+class View:
+    """A stored query result, and the state needed to maintain it."""
+    name: str
+    statement: Select
+    database: Dict[str, Table]
+    base: Table
+    table: Table
+    plan: Optional[plans.Plan] = None
+    accumulators: List[Accumulator] = field(default_factory=list)
+    seen: Set[Row] = field(default_factory=set)
+    keys: List[Row] = field(default_factory=list)
+    maintained: int = 0
+
+VIEWS: List[View] = []
+
+def find(name: str, tables: Dict[str, Table]) -> Optional[View]:
+    for view in VIEWS:
+        if view.name == name and view.database is tables:
+            return view
+    return None
+
+def unseen(view: View, rows: List[Any], key: Any = lambda row: row) -> List[Any]:
+    """Filter out rows already in a DISTINCT view, remembering the new ones."""
+    result = []
+    for row in rows:
+        value = key(row)
+        if value not in view.seen:
+            view.seen.add(value)
+            result.append(row)
+    return result
+
+def extend(view: View, rows: List[Row]) -> Optional[List[Row]]:
+    """Add the result of some new base rows to the view.
+
+    Returns the rows appended to the end of the view, or `None` if they were merged into it.
+    """
+    statement = view.statement
+    compiled = view.plan
+    assert compiled
+    if compiled.predicate:
+        rows = list(filter(compiled.predicate, rows))
+    if compiled.aggregates:
+        for row in rows:
+            compiled.accumulate(view.accumulators, row)
+        view.table.rows[:] = [compiled.finish(view.accumulators)]
+        return None
+    projected = list(map(compiled.project, rows))  # type: ignore
+    if not statement.order:
+        if statement.distinct:
+            projected = unseen(view, projected)
+        if statement.limit is not None:
+            projected = projected[:max(0, statement.limit - len(view.table.rows))]
+        view.table.rows.extend(projected)
+        return projected
+    first = operator.itemgetter(0)
+    pairs = sorted(zip(map(compiled.order_key, rows), projected),  # type: ignore
+                   key=first, reverse=statement.descending)
+    if statement.distinct:
+        pairs = unseen(view, pairs, operator.itemgetter(1))
+    merged = list(heapq.merge(zip(view.keys, view.table.rows), pairs,
+                              key=first, reverse=statement.descending))
+    if statement.limit is not None:
+        merged = merged[:statement.limit]
+    view.keys[:] = [key for key, _ in merged]
+    view.table.rows[:] = [row for _, row in merged]
+    return None
+
+def rebuild(view: View) -> bool:
+    """Recompute the view from the whole of its base table."""
+    statement = view.statement
+    compiled = plans.plan(statement, {statement.table: view.base}, optimise_plan=False)
+    if not compiled:
+        log.error(f"Materialized view `{view.name}` cannot be refreshed.")
+        return False
+    if statement.offset:
+        log.error(f"Materialized view `{view.name}` cannot use OFFSET.")
+        return False
+    if statement.sample is not None:
+        log.error(f"Materialized view `{view.name}` cannot use TABLESAMPLE.")
+        return False
+    if statement.distinct and statement.order and not set(statement.order) <= set(compiled.columns):
+        log.error(f"Materialized view `{view.name}` must select the columns it is ordered by.")
+        return False
+    view.plan = compiled
+    view.accumulators = compiled.start()
+    view.table.columns[:] = compiled.columns
+    view.table.rows.clear()
+    view.seen.clear()
+    view.keys.clear()
+    extend(view, view.base.rows)
+    view.maintained = len(view.base.rows)
+    return True
+
+def maintain(table: Table, appended: Optional[List[Row]]) -> None:
+    """Update the views over `table` after it has been refreshed."""
+    for view in list(VIEWS):
+        if view.base is not table:
+            continue
+        if appended is None:
+            rebuild(view)
+            changed = None
+        else:
+            changed = extend(view, appended)
+            view.maintained += len(appended)
+        log.debug(f"Maintained materialized view `{view.name}`.")
+        for hook in database.REFRESH_HOOKS:
+            hook(view.table, changed)
+
+database.REFRESH_HOOKS.append(maintain)
+
+def create(statement: CreateView, tables: Dict[str, Table]) -> Optional[Table]:
+    """Materialize a view, storing it in `tables` under its name."""
+    base = tables.get(statement.select.table)
+    if not base:
+        log.error(f"Table `{statement.select.table}` not found")
+        return None
+    existing = find(statement.name, tables)
+    if statement.name in tables and not existing:
+        log.error(f"Table `{statement.name}` already exists.")
+        return None
+    view = View(statement.name, statement.select, tables, base, Table([], []))
+    if not rebuild(view):
+        return None
+    if existing:
+        VIEWS.remove(existing)
+    VIEWS.append(view)
+    tables[statement.name] = view.table
+    log.info(f"Materialized view `{view.name}` created with {len(view.table.rows)} rows.")
+    return view.table
+
+def stale_reason(view: View) -> Optional[str]:
+    """Explain why the view may not reflect its base table, if it may not."""
+    if view.maintained != len(view.base.rows):
+        return f"`{view.statement.table}` has changed since it was last maintained"
+    if view.base.source and database.has_changed(view.base.source):
+        return f"`{view.base.source.path}` has been modified since it was last loaded"
+    for base_view in VIEWS:
+        if base_view.table is view.base:
+            return stale_reason(base_view)
+    return None
+
+def report(name: str, tables: Dict[str, Table]) -> None:
+    """Log whether a view is up to date, if `name` is a view."""
+    view = find(name, tables)
+    if not view:
+        return
+    reason = stale_reason(view)
+    if reason:
+        log.warning(f"Materialized view `{name}` is stale: {reason}.")
+    else:
+        log.info(f"Materialized view `{name}` is up to date with {view.maintained} rows of "
+                 f"`{view.statement.table}`.")
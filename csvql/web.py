@@ -1,22 +1,23 @@
 """Define a simple webserver for a barebones SQL dashboard."""
 
-import time
 import json
+import functools
 
 import queue
+import threading
 
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from typing import Any, Dict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
 
 import logging
 from logging.handlers import QueueHandler
 
-import os
 import re
-from urllib.parse import unquote
+from urllib.parse import unquote, urlparse, parse_qs
 
-from . import tokenise, parse, interpret, execute
-from . import database
+from . import execute
+from . import database, cursors, memory
+from .transactions import Select
 
 log = logging.getLogger(__name__)
 
@@ -25,7 +26,7 @@ user_log = QueueHandler(log_queue)
 user_log.setLevel("INFO")
 formatter = logging.Formatter('%(levelname)s (%(module)s): %(message)s')
 user_log.setFormatter(formatter)
-for child in ["tokenise", "execute", "parse", "interpret"]:
+for child in ["tokenise", "execute", "parse", "interpret", "reg_parse", "views", "cursors", "filters", "plans", "aggregates", "stats", "indexes", "memory", "web"]:
     logging.root.getChild(f"csvql.{child}").addHandler(user_log)
 
 console_log = logging.StreamHandler()
@@ -34,43 +35,79 @@ formatter = logging.Formatter('%(asctime)s %(levelname)s: %(message)s')
 console_log.setFormatter(formatter)
 logging.root.getChild(f"csvql.web").addHandler(console_log)
 
-myregex = "^" + "(?P<name>.*)" + "\.csv" + "$"
-
 DATABASE: Dict[str, database.Table] = {}
 
-log.info("Loading tables...")
-for file in os.listdir("../data/"):
-    match = re.match(myregex, file)
-    if not match:
-        continue
-    name = match.group('name')
-    if not name:
-        continue
-    table = database.load_table("../data/" + name + ".csv")
-    if not table:
-        continue
-    DATABASE.update({name : table})
+CURSORS = cursors.Cursors()
+database.REFRESH_HOOKS.append(CURSORS.invalidate)
 
-log.info("Loaded tables: %s", DATABASE.keys())
+# Queries wait to start while the memory budgets of those running would exceed the cap.
+GOVERNOR = memory.Governor(memory.DEFAULT_CAP)
+BUDGET_HEADER = "X-Memory-Budget"
 
+CURSOR_PATH = re.compile(r"^/cursor/(?P<cursor_id>\w+)$")
 
 HOSTNAME = "localhost"
 HOSTPORT = 8080
 
+ASSETS: Dict[str, Tuple[str, str]] = {
+    "/": ("web/index.html", "text/html; charset=utf-8"),
+    "/main.js": ("web/main.js", "text/javascript; charset=utf-8"),
+    "/style.css": ("web/style.css", "text/css; charset=utf-8"),
+}
+
 def sanitise(string: str) -> str:
     """Cleans up a http string."""
     return str(unquote(string))
 
-with open('web/index.html', 'r') as html_file:
-    WEB_PAGE = html_file.read()
+def page_size(query: str) -> int:
+    """Read the requested page size from a query string, e.g. `rows=50`."""
+    try:
+        return int(parse_qs(query).get("rows", [cursors.PAGE_SIZE])[0])
+    except ValueError:
+        return cursors.PAGE_SIZE
+
+def budget_limit(size: Optional[str]) -> Optional[int]:
+    """Read the memory budget requested for each query, defaulting to `memory.DEFAULT_BUDGET`."""
+    return memory.DEFAULT_BUDGET if size is None else memory.parse_size(size)
 
-with open('web/main.js', 'r') as js_file:
-    WEB_SCRIPT = js_file.read()
+def take_messages() -> List[str]:
+    """Remove and return the messages logged while handling this thread's request."""
+    thread = threading.get_ident()
+    with log_queue.mutex:
+        records = [record for record in log_queue.queue if record.thread == thread]
+        for record in records:
+            log_queue.queue.remove(record)
+    return [record.getMessage() for record in records]
 
-with open('web/style.css', 'r') as css_file:
-    WEB_STYLE = css_file.read()
+@functools.lru_cache(maxsize=None)
+def read_asset(path: str) -> bytes:
+    """Read a static web asset, caching it after the first request."""
+    with open(path, 'rb') as asset_file:
+        return asset_file.read()
+
+def batch_queries(body: bytes) -> Optional[List[str]]:
+    """Read the list of queries from a batch request body."""
+    try:
+        queries = json.loads(body)
+    except ValueError as err:
+        log.error(f"Batch request is not valid JSON: {err}")
+        return None
+    if isinstance(queries, dict):
+        queries = queries.get("queries")
+    if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+        log.error("Batch request must be a list of query strings.")
+        return None
+    return queries
+
+def load_database(data_path: str = database.DATA_PATH) -> None:
+    """Populate `DATABASE` with the tables found in `data_path`."""
+    log.info("Loading tables...")
+    DATABASE.update(database.load_directory(data_path))
+    log.info("Loaded tables: %s", DATABASE.keys())
 
 def varify(obj: Any) -> Any:
+    if isinstance(obj, (str, int, float)):
+        return obj
     if isinstance(obj, set):
         return list(obj)
     if isinstance(obj, dict):
@@ -78,11 +115,11 @@ def varify(obj: Any) -> Any:
             obj[k] = varify(v)
         return obj
     if isinstance(obj, list):
-        return obj
+        return [varify(value) for value in obj]
     if obj is None:
         return obj
     if isinstance(obj, tuple):
-        return varify(obj._asdict())
+        return varify(obj._asdict()) if hasattr(obj, "_asdict") else obj
     if not hasattr(obj, '__dict__'):
         log.debug("Unhandled varify object %s", obj)
         return obj
@@ -96,46 +133,128 @@ class MyServer(BaseHTTPRequestHandler):
     """Just a very basic server."""
     def do_GET(self) -> None:
         self.send_response(200, "OK")
-        if self.path == "/":
-            self.send_header("content-type", "text/html; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(bytes(WEB_PAGE, "utf-8"))
-        elif self.path == "/main.js":
-            self.send_header("content-type", "text/javascript; charset=utf-8")
+        if self.path in ASSETS:
+            path, content_type = ASSETS[self.path]
+            self.send_header("content-type", content_type)
             self.end_headers()
-            self.wfile.write(bytes(WEB_SCRIPT, "utf-8"))
-        elif self.path == "/style.css":
-            self.send_header("content-type", "text/css; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(bytes(WEB_STYLE, "utf-8"))   
+            self.wfile.write(read_asset(path))
         else:
-            log_queue.queue.clear()
-            query = sanitise(self.path[1:])
-            log.debug("Query: %s", query)
-            tokens = tokenise.tokenise(query)
-            log.debug("Tokens: %s", tokens)
-            tree = parse.parse(tokens)
-            log.debug("Tree: %s", tree)
-            command = interpret.make_select(tree)
-            log.debug("Command: %s", command)
-            result = execute.select(command, DATABASE)
-            log.debug("Result: %s", result)
-            self.wfile.write(bytes(json.dumps(varify({"value" : result, "messages" : [record.getMessage() for record in list(log_queue.queue)]})), "utf-8"))
+            take_messages()
+            url = urlparse(self.path)
+            match = CURSOR_PATH.match(url.path)
+            try:
+                if match:
+                    # Wait for admission before locking the tables, as `run_query` does.
+                    CURSORS.resume(match.group("cursor_id"))
+                    with database.TABLES_LOCK.reading():
+                        page = CURSORS.fetch(match.group("cursor_id"), page_size(url.query))
+                else:
+                    page = self.run_query(sanitise(self.path[1:]))
+            except memory.MemoryBudgetExceeded as err:
+                log.error(str(err))
+                page = None
+            if page and page.budget:
+                page.budget.report()
+            log.debug("Page: %s", page)
+            self.send_header("content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(bytes(json.dumps(varify({
+                "value" : database.Table(page.columns, page.rows) if page else None,
+                "cursor" : page.cursor_id if page and page.more else None,
+                "messages" : take_messages()
+            })), "utf-8"))
             #self.wfile.write(bytes(json.dumps(varify(parse(sanitise(self.path)))), "utf-8"))
+
+    def run_query(self, query: str) -> Optional[cursors.Page]:
+        """Run a query, returning its first page and leaving the rest behind a cursor.
+
+        The query waits for its memory budget to be admitted. Between pages its cursor keeps
+        reserved only the memory its rows hold, and waits for the whole budget again to fetch more.
+        """
+        log.debug("Query: %s", query)
+        statements = execute.prepare(query)
+        if len(statements) != 1:
+            log.error("Send one statement at a time, or POST a batch of them.")
+            return None
+        command = statements[0]
+        log.debug("Command: %s", command)
+        limit = budget_limit(self.headers.get(BUDGET_HEADER))
+        if limit is None:
+            return None
+        budget = memory.Budget(limit)
+        database.refresh_database(DATABASE)
+        # Idle cursors may hold reservations that this query is waiting for.
+        CURSORS.expire()
+        release = GOVERNOR.reserve(limit)
+        with database.TABLES_LOCK.reading():
+            result = None
+            try:
+                result = execute.stream(command, DATABASE, budget)
+            finally:
+                if not result:
+                    release()
+            if not result:
+                return None
+            table = DATABASE.get(command.table) if isinstance(command, Select) else None
+            return CURSORS.fetch(CURSORS.open(*result, budget, table, release, GOVERNOR.reserve))
     
     def do_POST(self) -> None:
-        log.info(f"incoming https: {self.path}")
+        """Run a batch of queries, sharing table scans between them.
+
+        The body is a JSON list of query strings, or an object with a `queries` list. Each
+        `;`-separated statement gets one entry in the `results` of the response. Each statement
+        has the memory budget given by the `X-Memory-Budget` header, and the batch waits for all
+        of them to be admitted. Batches whose budgets add up to more than the server's cap are
+        refused.
+        """
+        log.debug(f"incoming https: {self.path}")
+        take_messages()
         content_length = int(self.headers['Content-Length'])
         post_data = self.rfile.read(content_length)
-        self.send_response(200)
+        queries = batch_queries(post_data)
+        limit = budget_limit(self.headers.get(BUDGET_HEADER))
+        results = None
+        if queries is None or limit is None:
+            self.send_response(400, "Bad Request")
+        else:
+            statements = [statement for query in queries for statement in execute.prepare(query)]
+            budgets = [memory.Budget(limit) for _ in statements]
+            total = limit * len(statements)
+            if total > GOVERNOR.cap:
+                log.error(f"The batch's {len(statements)} statements need "
+                          f"{memory.format_size(total)}, more than the server's cap of "
+                          f"{memory.format_size(GOVERNOR.cap)}.")
+                self.send_response(413, "Payload Too Large")
+            else:
+                database.refresh_database(DATABASE)
+                CURSORS.expire()
+                try:
+                    with GOVERNOR.admit(total), database.TABLES_LOCK.reading():
+                        results = [{"value": result} for result
+                                   in execute.select_many(statements, DATABASE, budgets)]
+                except memory.MemoryBudgetExceeded as err:
+                    log.error(str(err))
+                if results is None:
+                    self.send_response(503, "Service Unavailable")
+                else:
+                    self.send_response(200, "OK")
+                    for i, budget in enumerate(budgets):
+                        budget.report(f"Statement {i + 1}")
+        self.send_header("content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(bytes(json.dumps(varify({
+            "results" : results,
+            "messages" : take_messages()
+        })), "utf-8"))
         #client.close()
     def log_message(self, format, *args) -> None:
         return
 
 
-def main() -> None:
+def main(data_path: str = database.DATA_PATH) -> None:
     """Run the webserver."""
-    MY_SERVER = HTTPServer((HOSTNAME, HOSTPORT), MyServer)
+    load_database(data_path)
+    MY_SERVER = ThreadingHTTPServer((HOSTNAME, HOSTPORT), MyServer)
 
     log.info(f"Server Starts - {HOSTNAME}:{HOSTPORT}")
 
@@ -0,0 +1,116 @@
+"""Test aggregates, sketches and sampled scans."""
+
+# mypy: disallow-untyped-defs=False
+# pylint: disable=missing-docstring
+
+import random
+import unittest
+
+from csvql import aggregates, plans
+from csvql.database import Table
+from csvql.execute import run, prepare, select_many
+from csvql.sketches import HyperLogLog, QuantileSketch
+
+DATABASE = {
+    "numbers": Table(["id", "mod", "word"], [
+        (str(i), str(i % 7), "even" if i % 2 == 0 else "odd") for i in range(10000)
+    ])
+}
+
+
+class Sketches(unittest.TestCase):
+    def test_hyperloglog(self):
+        sketch = HyperLogLog()
+        for i in range(50000):
+            sketch.add(str(i))
+        self.assertAlmostEqual(sketch.estimate() / 50000, 1, delta=4 * sketch.relative_error())
+
+    def test_hyperloglog_small(self):
+        sketch = HyperLogLog()
+        for i in range(100):
+            sketch.add(str(i % 10))
+        self.assertAlmostEqual(sketch.estimate(), 10, delta=0.5)
+
+    def test_quantile(self):
+        sketch = QuantileSketch(size=1000, rand=random.Random(1))
+        for i in range(100000):
+            sketch.add(i)
+        self.assertAlmostEqual(sketch.quantile(0.9), 90000, delta=100000 * sketch.rank_error())
+
+    def test_quantile_exact(self):
+        sketch = QuantileSketch()
+        for i in range(100):
+            sketch.add(i)
+        self.assertEqual(sketch.quantile(0.5), 50)
+        self.assertEqual(sketch.rank_error(), 0)
+
+
+class Aggregates(unittest.TestCase):
+    def test_exact(self):
+        self.assertEqual(
+            run("select count(*), sum(id), range(id), count(distinct mod) from numbers",
+                DATABASE).rows,
+            [("10000", "49995000", "9999", "7")])
+
+    def test_where(self):
+        self.assertEqual(run("select count(id) from numbers where mod = 0", DATABASE).rows,
+                         [("1429",)])
+
+    def test_approximate(self):
+        with self.assertLogs("csvql.aggregates", "INFO") as logs:
+            result = run("select approx_count_distinct(id), approx_quantile(id, 50) from numbers",
+                         DATABASE)
+        self.assertEqual(result.columns, ["approx_count_distinct(id)", "approx_quantile(id, 50)"])
+        distinct, median = result.rows[0]
+        self.assertAlmostEqual(int(distinct), 10000, delta=700)
+        self.assertAlmostEqual(int(median), 5000, delta=500)
+        self.assertIn("95% confidence", logs.output[0])
+
+    def test_quantile_argument(self):
+        self.assertIsNone(run("select approx_quantile(id, 200) from numbers", DATABASE))
+
+    def test_mixed_columns(self):
+        self.assertIsNone(run("select id, count(*) from numbers", DATABASE))
+
+    def test_incomplete_accumulator(self):
+        class Incomplete(aggregates.Accumulator):
+            def add(self, value):
+                pass
+
+        with self.assertRaises(TypeError):
+            Incomplete(None)
+
+
+class TableSample(unittest.TestCase):
+    def setUp(self):
+        plans.SAMPLE_RANDOM.seed(0)
+
+    def test_count_scaled(self):
+        with self.assertLogs("csvql.aggregates", "INFO") as logs:
+            result = run("select count(*) from numbers tablesample 10 percent where word = even",
+                         DATABASE)
+        self.assertAlmostEqual(int(result.rows[0][0]), 5000, delta=500)
+        self.assertRegex(logs.output[0], r"`count\(\*\)` ≈ \d+, ± [\d.]+ \(95% confidence\)")
+
+    def test_unfiltered_count_exact(self):
+        self.assertEqual(run("select count(*) from numbers tablesample 5", DATABASE).rows,
+                         [("10000",)])
+
+    def test_sum_scaled(self):
+        result = run("select sum(id) from numbers tablesample 20 percent", DATABASE)
+        self.assertAlmostEqual(float(result.rows[0][0]), 49995000, delta=5000000)
+
+    def test_sample_size(self):
+        self.assertEqual(len(run("select id from numbers tablesample 1 percent", DATABASE).rows),
+                         100)
+
+    def test_not_a_number(self):
+        with self.assertLogs("csvql.interpret", "ERROR"):
+            self.assertEqual(prepare("select id from numbers tablesample abc"), (None,))
+
+    def test_shared_scan(self):
+        counts, first = select_many(
+            list(prepare("select count(*) from numbers; select id from numbers limit 1")),
+            DATABASE)
+        self.assertEqual(counts.rows, [("10000",)])
+        self.assertEqual(first.rows, [("0",)])
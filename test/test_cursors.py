@@ -0,0 +1,94 @@
+"""Test server-side cursors."""
+
+# mypy: disallow-untyped-defs=False
+# pylint: disable=missing-docstring
+
+import unittest
+
+from csvql import memory
+from csvql.cursors import Cursors
+from csvql.database import Table
+
+
+class Paging(unittest.TestCase):
+    def setUp(self):
+        self.cursors = Cursors()
+        self.consumed = 0
+
+    def rows(self, count):
+        for i in range(count):
+            self.consumed += 1
+            yield (str(i),)
+
+    def test_pages(self):
+        cursor_id = self.cursors.open(["n"], self.rows(5))
+        page = self.cursors.fetch(cursor_id, 2)
+        self.assertEqual((page.rows, page.more), ([("0",), ("1",)], True))
+        page = self.cursors.fetch(cursor_id, 2)
+        self.assertEqual((page.rows, page.more), ([("2",), ("3",)], True))
+        page = self.cursors.fetch(cursor_id, 2)
+        self.assertEqual((page.rows, page.more), ([("4",)], False))
+        self.assertEqual(len(self.cursors), 0)
+
+    def test_lazy(self):
+        cursor_id = self.cursors.open(["n"], self.rows(1000))
+        self.cursors.fetch(cursor_id, 10)
+        self.assertEqual(self.consumed, 11)
+
+    def test_exact_page(self):
+        cursor_id = self.cursors.open(["n"], self.rows(2))
+        self.assertFalse(self.cursors.fetch(cursor_id, 2).more)
+
+    def test_unknown(self):
+        with self.assertLogs("csvql.cursors", "ERROR"):
+            self.assertIsNone(self.cursors.fetch("nope"))
+
+    def test_expire(self):
+        cursors = Cursors(timeout=-1)
+        cursor_id = cursors.open(["n"], self.rows(5))
+        with self.assertLogs("csvql.cursors", "ERROR"):
+            self.assertIsNone(cursors.fetch(cursor_id))
+
+    def test_release(self):
+        released = []
+        cursor_id = self.cursors.open(["n"], self.rows(3), release=lambda: released.append(1))
+        self.cursors.fetch(cursor_id, 2)
+        self.assertEqual(released, [])
+        self.cursors.fetch(cursor_id, 2)
+        self.assertEqual(released, [1])
+        cursor_id = self.cursors.open(["n"], self.rows(3), release=lambda: released.append(2))
+        self.cursors.close(cursor_id)
+        self.assertEqual(released, [1, 2])
+
+    def test_resume(self):
+        governor = memory.Governor(100, timeout=0.01)
+        budget = memory.Budget(60)
+        cursor_id = self.cursors.open(["n"], self.rows(5), budget, release=governor.reserve(60),
+                                      reserve=governor.reserve)
+        self.cursors.fetch(cursor_id, 2)
+        self.assertEqual(governor.reserved, 0)
+        with governor.admit(50):
+            with self.assertRaises(memory.MemoryBudgetExceeded):
+                self.cursors.resume(cursor_id)
+        self.assertEqual(len(self.cursors), 0)
+        cursor_id = self.cursors.open(["n"], self.rows(5), budget, release=governor.reserve(60),
+                                      reserve=governor.reserve)
+        self.cursors.fetch(cursor_id, 2)
+        self.cursors.resume(cursor_id)
+        self.assertEqual(governor.reserved, 60)
+        self.cursors.fetch(cursor_id, 5)
+        self.assertEqual(governor.reserved, 0)
+
+    def test_invalidate(self):
+        table = Table(["n"], [("0",), ("1",)])
+        cursor_id = self.cursors.open(["n"], iter(table.rows), table=table)
+        self.cursors.invalidate(table, [("2",)])
+        self.assertEqual(len(self.cursors), 1)
+        with self.assertLogs("csvql.cursors", "WARNING"):
+            self.cursors.invalidate(table, None)
+        with self.assertLogs("csvql.cursors", "ERROR"):
+            self.assertIsNone(self.cursors.fetch(cursor_id))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+"""Test loading and refreshing CSV files."""
+
+# mypy: disallow-untyped-defs=False
+# pylint: disable=missing-docstring
+
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from csvql import database
+
+
+class Refresh(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".csv")
+        os.close(handle)
+        self.write("id,name\n1,apple\n2,kale\n")
+        self.table = database.load_table(self.path)
+        self.calls = []
+        database.REFRESH_HOOKS.append(self.hook)
+
+    def tearDown(self):
+        database.REFRESH_HOOKS.remove(self.hook)
+        os.remove(self.path)
+
+    def hook(self, table, rows):
+        self.calls.append((table, rows))
+
+    def write(self, text, mode="w"):
+        with open(self.path, mode) as csv_file:
+            csv_file.write(text)
+
+    def test_load(self):
+        self.assertEqual(self.table.rows, [("1", "apple"), ("2", "kale")])
+        self.assertEqual(self.table.source.row_count, 2)
+
+    def test_unchanged(self):
+        database.refresh_table(self.table)
+        self.assertEqual(self.calls, [])
+
+    def test_append(self):
+        rows = self.table.rows
+        self.write("3,pear\n", "a")
+        database.refresh_table(self.table)
+        self.assertIs(self.table.rows, rows)
+        self.assertEqual(self.table.rows[-1], ("3", "pear"))
+        self.assertEqual(self.table.source.row_count, 3)
+        self.assertEqual(self.calls, [(self.table, [("3", "pear")])])
+
+    def test_rewrite(self):
+        self.write("id,name\n9,plum\n8,fig\n7,yam\n")
+        database.refresh_table(self.table)
+        self.assertEqual(self.table.rows, [("9", "plum"), ("8", "fig"), ("7", "yam")])
+        self.assertEqual(self.calls, [(self.table, None)])
+
+    def test_partial_line(self):
+        self.write("3,pe", "a")
+        database.refresh_table(self.table)
+        self.assertEqual(self.table.rows, [("1", "apple"), ("2", "kale")])
+        self.write("ar\n", "a")
+        database.refresh_table(self.table)
+        self.assertEqual(self.table.rows[-1], ("3", "pear"))
+        self.assertEqual(len(self.table.rows), 3)
+        self.assertEqual(self.calls, [(self.table, []), (self.table, [("3", "pear")])])
+
+    def test_unterminated_last_line(self):
+        self.write("id,name\n1,apple\n2,kale")
+        table = database.load_table(self.path)
+        self.assertEqual(table.rows, [("1", "apple"), ("2", "kale")])
+        self.write("\n3,pear\n", "a")
+        database.refresh_table(table)
+        self.assertEqual(table.rows, [("1", "apple"), ("2", "kale"), ("3", "pear")])
+        self.assertEqual(self.calls, [(table, [("3", "pear")])])
+
+    def test_unfinished_last_line(self):
+        self.write("id,name\n1,apple\n2,ka")
+        table = database.load_table(self.path)
+        self.write("le\n", "a")
+        database.refresh_table(table)
+        self.assertEqual(table.rows, [("1", "apple"), ("2", "kale")])
+        self.assertEqual(self.calls, [(table, None)])
+
+    def test_concurrent(self):
+        self.write("3,pear\n", "a")
+        barrier = threading.Barrier(8)
+        encode = database.encode
+
+        def slow_encode(rows, encoder):
+            # Widen the window between checking the file and recording what was read.
+            time.sleep(0.02)
+            return encode(rows, encoder)
+
+        def refresh():
+            barrier.wait()
+            database.refresh_table(self.table)
+
+        with mock.patch.object(database, "encode", slow_encode):
+            threads = [threading.Thread(target=refresh) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(self.table.rows, [("1", "apple"), ("2", "kale"), ("3", "pear")])
+        self.assertEqual(len(self.calls), 1)
+
+    def test_reload_waits_for_readers(self):
+        self.write("id,name\n9,plum\n")
+        with database.TABLES_LOCK.reading():
+            thread = threading.Thread(target=database.refresh_table, args=(self.table,))
+            thread.start()
+            time.sleep(0.05)
+            self.assertEqual(self.table.rows, [("1", "apple"), ("2", "kale")])
+        thread.join()
+        self.assertEqual(self.table.rows, [("9", "plum")])
+
+
+class Compact(unittest.TestCase):
+    def test_shared_values(self):
+        table = database.read_table(io.StringIO("id,cat\n1,fruit\n2,fruit\n"))
+        self.assertEqual(table.rows, [("1", "fruit"), ("2", "fruit")])
+        self.assertIs(table.rows[0][1], table.rows[1][1])
+
+    def test_lists(self):
+        table = database.read_table(io.StringIO("id,cat\n1,fruit\n"), compact=False)
+        self.assertEqual(table.rows, [["1", "fruit"]])
+
+    def test_unique_column_pruned(self):
+        encoder = database.Encoder(2)
+        for i in range(database.DICTIONARY_CHECK):
+            encoder([str(i), "fruit"])
+        self.assertIsNone(encoder.dictionaries[0])
+        self.assertIsNotNone(encoder.dictionaries[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
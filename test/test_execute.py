@@ -0,0 +1,149 @@
+"""Test SQL execution."""
+
+# mypy: disallow-untyped-defs=False
+# pylint: disable=missing-docstring
+
+import io
+import os
+import tempfile
+import unittest
+
+from csvql import cli
+from csvql.database import Table
+from csvql.execute import PARSERS, run, prepare, select_many
+
+DATABASE = {
+    "food": Table(["id", "name", "cat"], [
+        ("1", "apple", "fruit"),
+        ("2", "kale", "veg"),
+        ("3", "pear", "fruit"),
+        ("4", "leek", "veg"),
+    ])
+}
+
+class Execute(unittest.TestCase):
+    def test_select_star(self):
+        self.assertEqual(run("select * from food", DATABASE), DATABASE["food"])
+
+    def test_select_columns(self):
+        self.assertEqual(run("select name, id from food limit 2", DATABASE).rows,
+                         [("apple", "1"), ("kale", "2")])
+
+    def test_distinct_order(self):
+        self.assertEqual(run("SELECT DISTINCT cat FROM food ORDER BY cat DESC", DATABASE).rows,
+                         [("veg",), ("fruit",)])
+
+    def test_offset_fetch(self):
+        self.assertEqual(
+            run("select id from food order by id desc offset 1 rows fetch first 2 rows only",
+                DATABASE).rows,
+            [("3",), ("2",)])
+
+    def test_keyword_columns(self):
+        table = Table(["rows", "percent"], [("1", "2"), ("3", "4")])
+        self.assertEqual(run("select rows, percent from t order by rows desc offset 1 rows",
+                             {"t": table}).rows, [("1", "2")])
+
+    def test_not_a_number(self):
+        for query in ("select id from food offset abc", "select id from food limit abc",
+                      "select id from food fetch first abc"):
+            with self.subTest(query=query):
+                with self.assertLogs("csvql.interpret", "ERROR"):
+                    self.assertEqual(prepare(query), (None,))
+
+    def test_where(self):
+        self.assertEqual(run("select name from food where cat = fruit and id > 1", DATABASE).rows,
+                         [("pear",)])
+
+    def test_where_dangling_and(self):
+        for parser in PARSERS:
+            with self.subTest(parser=parser):
+                with self.assertLogs(level="ERROR"):
+                    self.assertEqual(prepare("select id from food where id = 5 and", parser),
+                                     (None,))
+
+    def test_where_missing_column(self):
+        self.assertIsNone(run("select name from food where colour = red", DATABASE))
+
+    def test_missing_table(self):
+        self.assertIsNone(run("select * from drink", DATABASE))
+
+    def test_missing_column(self):
+        self.assertIsNone(run("select colour from food", DATABASE))
+
+    def test_multiple_statements(self):
+        self.assertEqual(len(prepare("select id from food; select name from food;")), 2)
+
+    def test_plan_cache(self):
+        self.assertIs(prepare("select id from food")[0], prepare("select id from food")[0])
+
+    def test_failures_not_cached(self):
+        for _ in range(2):
+            with self.assertLogs("csvql", "ERROR"):
+                self.assertEqual(prepare("select from food"), (None,))
+
+
+class CountingRows(list):
+    scans = 0
+
+    def __iter__(self):
+        CountingRows.scans += 1
+        return super().__iter__()
+
+
+class SharedScan(unittest.TestCase):
+    def test_one_scan(self):
+        rows = CountingRows(DATABASE["food"].rows)
+        database = {"food": Table(DATABASE["food"].columns, rows)}
+        queries = ["select name from food where cat = veg",
+                   "select distinct cat from food order by cat",
+                   "select id from food limit 1",
+                   "select id from drink"]
+        statements = [statement for query in queries for statement in prepare(query)]
+        # The first run also reads the rows once to gather the planner's statistics.
+        select_many(statements, database)
+        CountingRows.scans = 0
+        results = select_many(statements, database)
+        self.assertEqual(CountingRows.scans, 1)
+        self.assertEqual(results[:3], [run(query, DATABASE) for query in queries[:3]])
+        self.assertIsNone(results[3])
+
+    def test_limit_zero(self):
+        rows = CountingRows(DATABASE["food"].rows)
+        database = {"food": Table(DATABASE["food"].columns, rows)}
+        statements = list(prepare("select id from food limit 0"))
+        select_many(statements, database)
+        CountingRows.scans = 0
+        self.assertEqual(select_many(statements, database)[0].rows, [])
+        self.assertEqual(CountingRows.scans, 0)
+
+
+class CommandLine(unittest.TestCase):
+    def test_csv(self):
+        out = io.StringIO()
+        self.assertTrue(cli.run_queries(["select id from food limit 1; select cat from food limit 1"],
+                                        DATABASE, "csv", out))
+        self.assertEqual(out.getvalue().splitlines(), ["id", "1", "", "cat", "fruit"])
+
+    def test_ndjson(self):
+        out = io.StringIO()
+        cli.run_queries(["select id, name from food limit 1"], DATABASE, "ndjson", out)
+        self.assertEqual(out.getvalue(), '{"id": "1", "name": "apple"}\n')
+
+    def test_failure(self):
+        self.assertFalse(cli.run_queries(["select id from drink"], DATABASE, "csv", io.StringIO()))
+
+    def test_lazy_tables(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ["food", "drink"]:
+                with open(os.path.join(directory, f"{name}.csv"), "w") as csv_file:
+                    csv_file.write("id\n1\n")
+            tables = cli.load_tables(cli.make_parser().parse_args(["query", "--data", directory]))
+            self.assertEqual(list(tables.keys()), [])
+            self.assertTrue(cli.run_queries(["select id from food"], tables, "csv", io.StringIO()))
+            self.assertEqual(list(tables.keys()), ["food"])
+            self.assertIn("drink", tables)
+
+
+if __name__ == "__main__":
+    unittest.main()
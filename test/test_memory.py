@@ -0,0 +1,156 @@
+"""Test memory budgets, spilling sorts and admission control."""
+
+# mypy: disallow-untyped-defs=False
+# pylint: disable=missing-docstring
+
+import random
+import threading
+import time
+import unittest
+
+from csvql import memory
+from csvql.database import Table
+from csvql.execute import prepare, select, select_many, stream
+
+RANDOM = random.Random(0)
+
+DATABASE = {
+    "numbers": Table(["id", "mod", "word"], [
+        (str(i), str(RANDOM.randrange(50)), RANDOM.choice(["a", "b", "c"])) for i in range(3000)
+    ])
+}
+
+
+class Sizes(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(memory.parse_size("512MiB"), 512 * 1024 ** 2)
+        self.assertEqual(memory.parse_size("2 gb"), 2 * 1000 ** 3)
+        self.assertEqual(memory.parse_size("1000"), 1000)
+
+    def test_parse_invalid(self):
+        with self.assertLogs("csvql.memory", "ERROR"):
+            self.assertIsNone(memory.parse_size("lots"))
+
+
+class Budgets(unittest.TestCase):
+    def test_allocate(self):
+        budget = memory.Budget(100)
+        budget.allocate(60, "Test")
+        budget.release(60)
+        budget.allocate(80, "Test")
+        self.assertEqual(budget.peak, 80)
+        with self.assertRaises(memory.MemoryBudgetExceeded):
+            budget.allocate(30, "Test")
+
+    def test_spilled_sort(self):
+        rows = [(str(RANDOM.randrange(100)), str(i)) for i in range(5000)]
+        for reverse in (False, True):
+            budget = memory.Budget(20000)
+            result = list(memory.sort(iter(rows), lambda row: row[0], reverse, budget))
+            self.assertEqual(result, sorted(rows, key=lambda row: row[0], reverse=reverse))
+            self.assertEqual(budget.spilled, len(rows))
+            self.assertEqual(budget.used, 0)
+
+    def test_query_spills(self):
+        budget = memory.Budget(50000)
+        _, rows = stream(prepare("select id from numbers order by mod desc")[0], DATABASE, budget)
+        unlimited = select(prepare("select id from numbers order by mod desc")[0], DATABASE)
+        self.assertEqual(list(rows), unlimited.rows)
+        self.assertGreater(budget.spilled, 0)
+
+    def test_top_k_spills(self):
+        query = prepare("select id from numbers order by mod limit 2000")[0]
+        budget = memory.Budget(50000)
+        _, rows = stream(query, DATABASE, budget)
+        self.assertEqual(list(rows), select(query, DATABASE).rows)
+        self.assertGreater(budget.spilled, 0)
+
+    def test_distinct_fails(self):
+        budget = memory.Budget(10000)
+        with self.assertLogs("csvql.execute", "ERROR") as logs:
+            self.assertIsNone(select(prepare("select distinct id from numbers")[0], DATABASE,
+                                     budget))
+        self.assertIn("DISTINCT", logs.output[0])
+
+    def test_stream_fails_when_consumed(self):
+        _, rows = stream(prepare("select distinct id from numbers")[0], DATABASE,
+                         memory.Budget(10000))
+        with self.assertRaises(memory.MemoryBudgetExceeded):
+            list(rows)
+
+    def test_shared_scan(self):
+        budgets = [memory.Budget(10000), memory.Budget()]
+        small, large = select_many(
+            list(prepare("select distinct id from numbers; select word from numbers")),
+            DATABASE, budgets)
+        self.assertIsNone(small)
+        self.assertEqual(len(large.rows), 3000)
+
+    def test_shared_scan_streams(self):
+        statements = list(prepare("select id from numbers order by mod limit 5; "
+                                  "select distinct word from numbers; "
+                                  "select distinct mod from numbers order by mod desc; "
+                                  "select id from numbers order by mod desc"))
+        budgets = [memory.Budget(20000) for _ in statements]
+        results = select_many(statements, DATABASE, budgets)
+        self.assertEqual([result.rows for result in results],
+                         [select(statement, DATABASE).rows for statement in statements])
+        self.assertGreater(budgets[3].spilled, 0)
+
+    def test_report(self):
+        budget = memory.Budget(memory.DEFAULT_BUDGET)
+        select(prepare("select id from numbers order by mod")[0], DATABASE, budget)
+        self.assertGreater(budget.peak, 0)
+        self.assertEqual(budget.used, 3000 * memory.row_size(DATABASE["numbers"].rows[0][:1]))
+        with self.assertLogs("csvql.memory", "INFO") as logs:
+            budget.report()
+        self.assertIn("of its 256.0 MiB budget", logs.output[0])
+
+
+class Admission(unittest.TestCase):
+    def test_queues(self):
+        governor = memory.Governor(100)
+        order = []
+        first = governor.admit(80)
+        first.__enter__()
+
+        def second():
+            with governor.admit(50):
+                order.append("second")
+
+        thread = threading.Thread(target=second)
+        with self.assertLogs("csvql.memory", "INFO"):
+            thread.start()
+            time.sleep(0.05)
+        order.append("first")
+        first.__exit__(None, None, None)
+        thread.join()
+        self.assertEqual(order, ["first", "second"])
+        self.assertEqual(governor.reserved, 0)
+
+    def test_over_cap(self):
+        governor = memory.Governor(100)
+        with self.assertRaises(memory.MemoryBudgetExceeded):
+            governor.reserve(101)
+        release = governor.reserve(100)
+        release()
+        release()
+        self.assertEqual(governor.reserved, 0)
+
+    def test_keep(self):
+        governor = memory.Governor(100)
+        release = governor.reserve(80)
+        release(30)
+        self.assertEqual(governor.reserved, 30)
+        with governor.admit(70):
+            self.assertEqual(governor.reserved, 100)
+        release()
+        self.assertEqual(governor.reserved, 0)
+
+    def test_timeout(self):
+        governor = memory.Governor(100, timeout=0.01)
+        with governor.admit(None):
+            with self.assertRaises(memory.MemoryBudgetExceeded):
+                with governor.admit(1):
+                    pass
+        self.assertEqual(governor.reserved, 0)
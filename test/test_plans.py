@@ -0,0 +1,133 @@
+"""Test the statistics-driven planner."""
+
+# mypy: disallow-untyped-defs=False
+# pylint: disable=missing-docstring
+
+import random
+import unittest
+
+from csvql import database, indexes, memory, plans, stats
+from csvql.database import Table
+from csvql.execute import run, prepare, select_many
+from csvql.transactions import Condition
+
+RANDOM = random.Random(0)
+
+def make_table():
+    return Table(["id", "group", "word"], [
+        (str(i), str(RANDOM.randrange(40)), RANDOM.choice(["a", "b", "c", "d"]))
+        for i in range(5000)
+    ])
+
+def naive(table, column_idx, order_idx, descending=False, distinct=False):
+    rows = sorted(table.rows, key=lambda row: [row[i] for i in order_idx], reverse=descending)
+    projected = [tuple(row[i] for i in column_idx) for row in rows]
+    if distinct:
+        projected = list(dict.fromkeys(projected))
+    return projected
+
+
+class Statistics(unittest.TestCase):
+    def setUp(self):
+        self.table = make_table()
+        self.stats = stats.table_stats(self.table)
+
+    def test_distinct(self):
+        self.assertAlmostEqual(self.stats.column(1).distinct(), 40, delta=2)
+        self.assertAlmostEqual(self.stats.distinct([1, 2], 5000), 160, delta=10)
+
+    def test_equality(self):
+        self.assertAlmostEqual(self.stats.selectivity([Condition("word", "=", "a")]), 0.25,
+                               delta=0.02)
+
+    def test_range(self):
+        self.assertAlmostEqual(self.stats.selectivity([Condition("id", "<", "1000")]), 0.2,
+                               delta=0.05)
+        self.assertAlmostEqual(self.stats.selectivity([Condition("id", ">=", "1000")]), 0.8,
+                               delta=0.05)
+
+    def test_recent_tables(self):
+        for _ in range(stats.MAX_TABLES):
+            stats.table_stats(Table(["id"], []))
+        self.assertNotIn(id(self.table), stats.STATS)
+        self.assertLessEqual(len(stats.STATS), stats.MAX_TABLES)
+
+    def test_catch_up(self):
+        self.stats.column(0)
+        self.table.rows.append(("5000", "1", "a"))
+        self.assertEqual(self.stats.column(0).rows, 5001)
+
+
+class Strategies(unittest.TestCase):
+    def setUp(self):
+        self.database = {"t": make_table()}
+
+    def steps(self, query):
+        return [row[0] for row in run("explain " + query, self.database).rows]
+
+    def test_index_lookup(self):
+        query = "select id, word from t where group = 7 and word = a"
+        self.assertEqual(self.steps(query), ["index lookup", "filter", "total"])
+        expected = [(row[0], row[2]) for row in self.database["t"].rows
+                    if row[1] == "7" and row[2] == "a"]
+        self.assertEqual(run(query, self.database).rows, expected)
+
+    def test_index_compares_numbers(self):
+        self.database["t"].rows.append(("5000", "7.0", "a"))
+        rows = run("select id from t where group = 7", self.database).rows
+        self.assertIn(("5000",), rows)
+
+    def test_index_maintained(self):
+        run("select id from t where group = 7", self.database)
+        self.database["t"].rows.append(("5000", "7", "a"))
+        self.assertIn(("5000",), run("select id from t where group = 7", self.database).rows)
+        for hook in database.REFRESH_HOOKS:
+            hook(self.database["t"], None)
+        self.assertIsNone(indexes.find(self.database["t"], 1))
+
+    def test_index_budget(self):
+        query = prepare("select id from t where group = 7")[0]
+        small = plans.plan(query, self.database, budget=memory.Budget(1000))
+        self.assertIsNone(small.lookup)
+        budget = memory.Budget()
+        compiled = plans.plan(query, self.database, budget=budget)
+        list(compiled.run(compiled.scan()))
+        self.assertGreaterEqual(budget.peak, indexes.index_size(5000))
+        self.assertEqual(budget.used, 0)
+
+    def test_scan_unselective(self):
+        self.assertEqual(self.steps("select id from t where word = a"), ["scan", "filter", "total"])
+
+    def test_distinct_first(self):
+        query = "select distinct word from t order by group desc"
+        self.assertEqual(self.steps(query)[1], "hash distinct, then sort")
+        self.assertEqual(run(query, self.database).rows,
+                         naive(self.database["t"], [2], [1], descending=True, distinct=True))
+
+    def test_sort_first(self):
+        query = "select distinct id, word from t order by word"
+        self.assertEqual(self.steps(query)[1], "sort, then distinct")
+        self.assertEqual(run(query, self.database).rows,
+                         naive(self.database["t"], [0, 2], [2], distinct=True))
+
+    def test_top_k(self):
+        query = "select id from t order by group desc limit 10"
+        self.assertEqual(self.steps(query)[1], "top-k sort")
+        self.assertEqual(run(query, self.database).rows,
+                         naive(self.database["t"], [0], [1], descending=True)[:10])
+
+    def test_select_many_lookup(self):
+        first, second = select_many(
+            list(prepare("select id from t where group = 7; select id from t limit 1")),
+            self.database)
+        self.assertEqual(first, run("select id from t where group = 7", self.database))
+        self.assertEqual(second.rows, [("0",)])
+
+    def test_explain_missing_table(self):
+        self.assertIsNone(run("explain select * from nothing", self.database))
+
+    def test_unoptimised(self):
+        compiled = plans.plan(prepare("select id from t where group = 7")[0], self.database,
+                              optimise_plan=False)
+        self.assertIsNone(compiled.lookup)
+        self.assertEqual(compiled.steps, [])
@@ -0,0 +1,90 @@
+"""Test reading compressed CSV files."""
+
+# mypy: disallow-untyped-defs=False
+# pylint: disable=missing-docstring
+
+import gzip
+import io
+import os
+import tempfile
+import unittest
+
+from csvql import database
+from csvql.readahead import ReadAhead
+
+
+class Failing(io.RawIOBase):
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        raise OSError("disk on fire")
+
+
+class ReadAheadStream(unittest.TestCase):
+    def test_blocks(self):
+        data = bytes(range(256)) * 100
+        with io.BufferedReader(ReadAhead(io.BytesIO(data), block_size=7, blocks=2)) as stream:
+            self.assertEqual(stream.read(), data)
+
+    def test_close_early(self):
+        stream = ReadAhead(io.BytesIO(b"x" * 1000), block_size=1, blocks=1)
+        self.assertEqual(stream.read(1), b"x")
+        stream.close()
+        self.assertTrue(stream.closed)
+
+    def test_error(self):
+        with ReadAhead(Failing()) as stream:
+            self.assertRaises(OSError, stream.read, 10)
+
+
+class Compressed(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "food.csv.gz")
+        with gzip.open(self.path, "wt") as csv_file:
+            csv_file.write("id,name\n1,apple\n2,kale\n")
+
+    def tearDown(self):
+        os.remove(self.path)
+        os.rmdir(self.directory)
+
+    def test_load(self):
+        table = database.load_table(self.path)
+        self.assertEqual(table.rows, [("1", "apple"), ("2", "kale")])
+        self.assertTrue(table.source.compressed)
+
+    def test_directory(self):
+        self.assertEqual(list(database.load_directory(self.directory)), ["food"])
+
+    def test_refresh(self):
+        table = database.load_table(self.path)
+        with gzip.open(self.path, "at") as csv_file:
+            csv_file.write("3,pear\n")
+        os.utime(self.path, (0, 0))
+        database.refresh_table(table)
+        self.assertEqual(table.rows[-1], ("3", "pear"))
+
+    def test_corrupt(self):
+        with gzip.open(self.path, "wt") as csv_file:
+            csv_file.write("id,name\n" + "1,apple\n" * 1000)
+        with open(self.path, "rb") as csv_file:
+            data = bytearray(csv_file.read())
+        data[20:40] = bytes(byte ^ 0xff for byte in data[20:40])
+        with open(self.path, "wb") as csv_file:
+            csv_file.write(data)
+        with self.assertLogs("csvql.database", "WARNING"):
+            self.assertEqual(database.load_directory(self.directory), {})
+
+    def test_missing_zstandard(self):
+        try:
+            import zstandard  # pylint: disable=unused-import,import-outside-toplevel
+            self.skipTest("zstandard is installed")
+        except ImportError:
+            pass
+        with self.assertLogs("csvql.database", "WARNING"):
+            self.assertIsNone(database.load_table(os.path.join(self.directory, "x.csv.zst")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Test the packrat parser."""
+
+# mypy: disallow-untyped-defs=False
+# pylint: disable=missing-docstring
+
+import unittest
+
+from csvql import parse, reg_parse
+from csvql.execute import prepare
+from csvql.tokenise import tokenise
+
+QUERIES = [
+    "select * from food",
+    "select name, id from food limit 2",
+    "SELECT DISTINCT cat FROM food ORDER BY cat DESC",
+    "select id from food order by id desc offset 1 rows fetch first 2 rows only",
+    "select name from food where cat = fruit and id > 1",
+    "select count(*), approx_quantile(id, 90) from food tablesample 10 percent",
+    "create materialized view cats as select distinct cat from food",
+]
+
+class Packrat(unittest.TestCase):
+    def test_same_as_parse(self):
+        for query in QUERIES:
+            with self.subTest(query=query):
+                tokens = tokenise(query)
+                self.assertEqual(reg_parse.parse_script(tokens), [parse.parse(tokens)])
+
+    def test_prepare(self):
+        script = "; ".join(QUERIES)
+        self.assertEqual(prepare(script, "packrat"), prepare(script, "recursive"))
+
+    def test_script(self):
+        statements = reg_parse.parse_script(tokenise("; ".join(QUERIES) + ";"))
+        self.assertEqual(len(statements), len(QUERIES))
+        self.assertTrue(all(statements))
+
+    def test_recovers_after_error(self):
+        with self.assertLogs("csvql.reg_parse", "ERROR") as logs:
+            statements = reg_parse.parse_script(
+                tokenise("select count(distinct id foo) from food; select id from food"))
+        self.assertIsNone(statements[0])
+        self.assertEqual(statements[1].expression, ["id"])
+        self.assertEqual(logs.output, ["ERROR:csvql.reg_parse:Could not parse 'foo ) from food'."])
+
+    def test_clause_order(self):
+        with self.assertLogs("csvql.reg_parse", "ERROR"):
+            self.assertEqual(reg_parse.parse_script(tokenise("select a from t limit 1 where a = 1")),
+                             [None])
+
+    def test_required_clause(self):
+        with self.assertLogs("csvql.reg_parse", "ERROR") as logs:
+            self.assertEqual(reg_parse.parse_script(tokenise("select a")), [None])
+        self.assertIn("`from` clause required.", logs.output[0])
+
+    def test_linear(self):
+        # Each rule is matched at most once per token, however long the script.
+        tokens = tokenise("; ".join(QUERIES * 50))
+        parser = reg_parse.Packrat(tokens)
+        calls = 0
+        rule = parser.rule
+
+        def counting(name, pos):
+            nonlocal calls
+            calls += (name, pos) not in parser.memo
+            return rule(name, pos)
+
+        parser.rule = counting
+        pos = 0
+        while pos < len(tokens):
+            pos = parser.rule("statement", pos).end
+        self.assertLessEqual(calls, len(reg_parse.PATTERNS) * len(tokens))
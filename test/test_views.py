@@ -0,0 +1,88 @@
+"""Test materialized views."""
+
+# mypy: disallow-untyped-defs=False
+# pylint: disable=missing-docstring
+
+import os
+import tempfile
+import unittest
+
+from csvql import database, execute, views
+from csvql.execute import run
+
+
+class MaterializedView(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".csv")
+        os.close(handle)
+        self.write("id,name,cat\n1,apple,fruit\n2,kale,veg\n3,pear,fruit\n")
+        self.database = {"food": database.load_table(self.path)}
+
+    def tearDown(self):
+        views.VIEWS.clear()
+        os.remove(self.path)
+
+    def write(self, text, mode="w"):
+        with open(self.path, mode) as csv_file:
+            csv_file.write(text)
+
+    def refresh(self, text):
+        self.write(text, "a")
+        database.refresh_database(self.database)
+
+    def test_create(self):
+        self.assertEqual(run("create materialized view cats as select distinct cat from food",
+                             self.database).rows, [("cats", "2")])
+        self.assertEqual(run("select * from cats", self.database).rows, [("fruit",), ("veg",)])
+
+    def test_append(self):
+        run("create materialized view cats as select distinct cat from food", self.database)
+        self.refresh("4,leek,veg\n5,salt,mineral\n")
+        self.assertEqual(self.database["cats"].rows, [("fruit",), ("veg",), ("mineral",)])
+
+    def test_ordered_merge(self):
+        run("create materialized view top as select name from food order by name desc limit 2",
+            self.database)
+        self.refresh("4,plum,fruit\n5,fig,fruit\n")
+        self.assertEqual(self.database["top"].rows, [("plum",), ("pear",)])
+
+    def test_reload(self):
+        run("create materialized view names as select name from food", self.database)
+        self.write("id,name,cat\n9,yam,veg\n")
+        database.refresh_database(self.database)
+        self.assertEqual(self.database["names"].rows, [("yam",)])
+
+    def test_aggregate(self):
+        run("create materialized view counts as select count(*), count(distinct cat) from food",
+            self.database)
+        self.refresh("4,leek,veg\n5,salt,mineral\n")
+        self.assertEqual(self.database["counts"].rows, [("5", "3")])
+
+    def test_view_of_view(self):
+        run("create materialized view names as select name, cat from food", self.database)
+        run("create materialized view veg as select distinct cat from names", self.database)
+        self.refresh("4,salt,mineral\n")
+        self.assertEqual(self.database["veg"].rows, [("fruit",), ("veg",), ("mineral",)])
+
+    def test_stale(self):
+        run("create materialized view names as select name from food", self.database)
+        self.write("4,leek,veg\n", "a")
+        with self.assertLogs("csvql.views", "WARNING"):
+            run("select * from names", self.database)
+
+    def test_name_clash(self):
+        self.assertIsNone(run("create materialized view food as select name from food",
+                              self.database))
+
+    def test_not_a_select(self):
+        for parser in execute.PARSERS:
+            for query in ("create materialized view v as "
+                          "create materialized view w as select name from food",
+                          "create materialized view v as explain select name from food"):
+                with self.subTest(parser=parser, query=query):
+                    with self.assertLogs("csvql.interpret", "ERROR"):
+                        self.assertEqual(execute.prepare(query, parser), (None,))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""Test the web server's query and batch endpoints."""
+
+# mypy: disallow-untyped-defs=False
+# pylint: disable=missing-docstring
+
+import http.client
+import json
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+
+from csvql import memory, web
+from csvql.database import Table
+
+
+class Batch(unittest.TestCase):
+    def setUp(self):
+        web.DATABASE["food"] = Table(["id", "cat"], [("1", "fruit"), ("2", "veg"), ("3", "fruit")])
+        web.DATABASE["numbers"] = Table(["n"], [(str(i),) for i in range(150)])
+        self.server = ThreadingHTTPServer(("localhost", 0), web.MyServer)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        web.DATABASE.clear()
+
+    def get(self, path):
+        connection = http.client.HTTPConnection(*self.server.server_address)
+        connection.request("GET", path)
+        response = json.loads(connection.getresponse().read())
+        connection.close()
+        return response
+
+    def post(self, body, headers=None):
+        connection = http.client.HTTPConnection(*self.server.server_address)
+        connection.request("POST", "/", body, {"content-type": "application/json",
+                                               **(headers or {})})
+        response = connection.getresponse()
+        result = response.status, json.loads(response.read())
+        connection.close()
+        return result
+
+    def test_batch(self):
+        status, response = self.post(json.dumps({"queries": [
+            "select id from food where cat = fruit; select count(*) from food"]}))
+        self.assertEqual(status, 200)
+        self.assertEqual([result["value"]["rows"] for result in response["results"]],
+                         [[["1"], ["3"]], [["3"]]])
+
+    def test_too_large(self):
+        status, response = self.post(json.dumps(["select id from food; select cat from food"]),
+                                     {"X-Memory-Budget": "600MiB"})
+        self.assertEqual(status, 413)
+        self.assertIn("more than the server's cap", response["messages"][0])
+
+    def test_cursor_reservation(self):
+        response = self.get("/select%20n%20from%20numbers%20order%20by%20n")
+        self.assertEqual(len(response["value"]["rows"]), 100)
+        # The cursor keeps reserved only the sorted rows it holds.
+        self.assertGreater(web.GOVERNOR.reserved, 0)
+        self.assertLess(web.GOVERNOR.reserved, memory.DEFAULT_BUDGET)
+        response = self.get(f"/cursor/{response['cursor']}")
+        self.assertEqual(len(response["value"]["rows"]), 50)
+        self.assertEqual(web.GOVERNOR.reserved, 0)
+
+    def test_suspended_cursors(self):
+        cursor_ids = [self.get("/select%20n%20from%20numbers")["cursor"] for _ in range(6)]
+        self.assertNotIn(None, cursor_ids)
+        self.assertEqual(web.GOVERNOR.reserved, 0)
+        for cursor_id in cursor_ids:
+            self.assertEqual(len(self.get(f"/cursor/{cursor_id}")["value"]["rows"]), 50)
+
+    def test_invalid_json(self):
+        status, response = self.post("[select")
+        self.assertEqual(status, 400)
+        self.assertIsNone(response["results"])
+        self.assertTrue(response["messages"])
+
+    def test_not_a_list(self):
+        status, response = self.post(json.dumps({"queries": "select id from food"}))
+        self.assertEqual(status, 400)
+        self.assertIsNone(response["results"])
+
+    def test_batch_queries(self):
+        self.assertEqual(web.batch_queries(b'["select id from food"]'), ["select id from food"])
+        with self.assertLogs("csvql.web", "ERROR"):
+            self.assertIsNone(web.batch_queries(b'[1, 2]'))
@@ -18,7 +18,11 @@ function drawTable(tablename, table) {
             rowNode.appendChild(cellNode);
     })
     tableNode.appendChild(rowNode)
-    table.rows.forEach(row => {
+    appendRows(tableNode, table.rows);
+}
+
+function appendRows(tableNode, rows) {
+    rows.forEach(row => {
         var rowNode = document.createElement("TR");
         row.forEach(cell => {
             var cellNode = document.createElement("TD");
@@ -36,8 +40,7 @@ function reqError() {
     alert("Error: Could not connect to server!")
 }
 
-function reqListener() {
-  console.log(this.response);
+function drawMessages(messages) {
   var table = document.getElementById('messages')
   table.innerHTML = ""
   var rowNode = document.createElement("TR");
@@ -46,18 +49,84 @@ function reqListener() {
   cellNode.appendChild(textNode);
   rowNode.appendChild(cellNode);
   table.appendChild(rowNode)
-  this.response.messages.forEach(message => {
+  messages.forEach(message => {
     addRow(table, message);
   });
-  drawTable("result", this.response.value);
+}
+
+function reqListener() {
+  console.log(this.response);
+  drawMessages(this.response.messages);
+  if (this.response.value) {
+    if (appending) {
+      appendRows(document.getElementById("result"), this.response.value.rows);
+    } else {
+      drawTable("result", this.response.value);
+    }
+  }
+  cursor = this.response.cursor;
+  document.getElementById("more").style.display = cursor ? "" : "none";
 }
 
 function sendRequest(str) {
     console.log(str);
+    appending = false;
     oReq.open("GET", "http://localhost:8080/" + str);
     oReq.send();
 }
 
+function fetchMore() {
+    if (!cursor) {
+        return;
+    }
+    appending = true;
+    oReq.open("GET", "http://localhost:8080/cursor/" + cursor + "?rows=" + pageSize);
+    oReq.send();
+}
+
+function sendBatch(queries, callback) {
+    var batchReq = new XMLHttpRequest();
+    batchReq.addEventListener("load", function () { callback(this.response); });
+    batchReq.addEventListener("error", reqError);
+    batchReq.responseType = "json";
+    batchReq.open("POST", "http://localhost:8080/");
+    batchReq.setRequestHeader("content-type", "application/json");
+    batchReq.send(JSON.stringify({"queries": queries}));
+}
+
+// Panels are refreshed together in one batch, so queries over the same table share a scan.
+function addPanel(str) {
+    panels.push(str);
+    refreshPanels();
+}
+
+function refreshPanels() {
+    if (panels.length == 0) {
+        return;
+    }
+    sendBatch(panels, drawPanels);
+}
+
+function drawPanels(response) {
+    console.log(response);
+    drawMessages(response.messages);
+    var panelsNode = document.getElementById("panels");
+    panelsNode.innerHTML = "";
+    (response.results || []).forEach((result, i) => {
+        var tableNode = document.createElement("TABLE");
+        tableNode.id = "panel-" + i;
+        panelsNode.appendChild(tableNode);
+        if (result.value) {
+            drawTable(tableNode.id, result.value);
+        }
+    });
+}
+
+var panels = [];
+var cursor = null;
+var appending = false;
+var pageSize = 100;
+
 var oReq = new XMLHttpRequest();
 oReq.addEventListener("load", reqListener);
 oReq.addEventListener("error", reqError);